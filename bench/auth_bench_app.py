@@ -0,0 +1,43 @@
+# auth_bench_app.py
+"""
+Load-test entry point for the auth backend: server/backend.py's app, set up
+for bench/loadtest.py's auth scenario and never deployed.
+
+Each virtual user logs in as its own account from its own client address,
+far more often than any real client would, so on top of the stock app this
+adds the accounts bench-0 .. bench-<n-1> (n from LOADTEST_AUTH_USERS, with
+the demo account's password) and lifts the per-IP and per-username rate
+limits. The in-flight caps and load shedding stay as deployed.
+
+loadtest.py --spawn starts it from the server/ directory:
+    python -m uvicorn --app-dir ../bench auth_bench_app:app
+"""
+import os
+
+import backend
+from admission import AdmissionMiddleware
+
+USERS = int(os.environ.get('LOADTEST_AUTH_USERS', '0'))
+
+
+class Unlimited:
+    """Stands in for a KeyedRateLimiter that admits everything."""
+
+    def acquire(self, key, now=None):
+        return 0.0
+
+
+def without_rate_limits(app):
+    """Drops the per-IP token buckets from the admission middleware (call before the first request)."""
+    for middleware in app.user_middleware:
+        if middleware.cls is AdmissionMiddleware:
+            kwargs = middleware.kwargs
+            kwargs['policies'] = {route: policy._replace(ip_rate=None) for route, policy in kwargs['policies'].items()}
+            kwargs['default_policy'] = kwargs['default_policy']._replace(ip_rate=None)
+    return app
+
+
+# One hash shared by all of them: hashing thousands at startup would take minutes
+backend.mock_users_db.update(dict.fromkeys((f'bench-{i}' for i in range(USERS)), backend.mock_users_db['user']))
+backend.login_attempts_per_user = Unlimited()
+app = without_rate_limits(backend.app)
@@ -0,0 +1,202 @@
+# generate_catalog.py
+"""
+Builds a synthetic shop database (jobs/ schema) of any size, for the query
+benchmarks in querybench.py and for load-testing against a realistic catalog.
+
+The output depends only on the arguments: the same --seed, --products and
+--categories always produce the same rows, so benchmark runs on different
+machines or commits compare like with like.
+
+Shape of the data:
+    - the three meta categories of init_db.py ('all', 'goods', 'services'),
+    - N generated categories, about 70% goods and 30% services,
+    - products spread over categories by a Zipf-like skew (a few huge
+      categories, a long tail of small ones), plus ~1% filed directly under
+      the 'goods'/'services' meta categories as the seed data does,
+    - goods get one-off prices, services monthly or yearly ones.
+
+The schema is built by migrations.py, so it always matches the app. For a
+fast bulk load the product indexes and triggers are dropped, rows go in
+with synchronous=OFF in large transactions, and afterwards the indexes are
+recreated and the search index, facet counts and change feed are rebuilt
+in one pass each (instead of triggers firing per row).
+
+Examples (from the repository root):
+    python bench/generate_catalog.py bench/catalog-100k.db
+    python bench/generate_catalog.py bench/catalog-2m.db --products 2000000 --categories 400
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'jobs'))
+
+from migrations import create_change_feed, create_facet_counts, create_search_index, migrate  # noqa: E402
+from pricing import format_price  # noqa: E402
+
+META_CATEGORIES = [
+    ('All Products & Services', 'all', 'meta'),
+    ('Goods', 'goods', 'meta'),
+    ('Services', 'services', 'meta'),
+]
+
+GOODS_SHARE = 0.7       # Fraction of generated categories that are goods
+META_PRODUCT_SHARE = 0.01  # Products filed directly under a meta category
+CATEGORY_SKEW = 0.9     # Zipf exponent for products per category (0 = uniform)
+BATCH_SIZE = 50000      # Rows per insert transaction
+
+GOODS_NOUNS = ['Phone', 'Book', 'Pad', 'Watch', 'Display', 'Speaker', 'Keyboard', 'Mouse', 'Pencil',
+               'Charger', 'Case', 'Cable', 'Adapter', 'Buds', 'Headphones', 'Tracker', 'Hub', 'Stand']
+SERVICE_NOUNS = ['Music', 'Cloud', 'TV', 'Arcade', 'Fitness', 'News', 'Care', 'Storage', 'Backup', 'Radio']
+LINES = ['Air', 'Pro', 'Max', 'Mini', 'Ultra', 'Studio', 'Plus', 'Lite', 'Neo', 'Go', 'One', 'Home']
+EDITIONS = ['', '', '', 'SE', 'Sport', 'Travel', 'Kids', 'Family', 'Edition', 'Classic']
+IMAGES = {
+    'goods': ['/static/images/product1.jpg', '/static/images/product2.jpg', '/static/images/product3.jpg',
+              '/static/images/product4.jpg', '/static/images/placeholder.jpg'],
+    'services': ['/static/images/service1.png', '/static/images/service2.png',
+                 '/static/images/service3.png', '/static/images/service4.png'],
+}
+
+
+# --- Data ---
+
+def generate_categories(rng, count):
+    """META_CATEGORIES plus `count` generated (name, slug, type) rows with unique names and slugs."""
+    categories = list(META_CATEGORIES)
+    for number in range(1, count + 1):
+        cat_type = 'goods' if rng.random() < GOODS_SHARE else 'services'
+        noun = rng.choice(GOODS_NOUNS if cat_type == 'goods' else SERVICE_NOUNS)
+        name = f"{noun} {rng.choice(LINES)} {number}"
+        categories.append((name, f"{noun.lower()}-{number}", cat_type))
+    return categories
+
+
+def random_price(rng, cat_type):
+    """(price, price_cents, currency, price_is_from, billing_period) for one product."""
+    if cat_type == 'services':
+        cents = rng.randrange(99, 3000)
+        period = 'month' if rng.random() < 0.8 else 'year'
+        if period == 'year':
+            cents *= 10
+        is_from = rng.random() < 0.2
+    else:
+        # Mostly round prices like "$799" or "$1099.99", as in the seed data
+        cents = rng.randrange(9, 4000) * 100 + rng.choice((0, 0, 0, 99))
+        period = None
+        is_from = rng.random() < 0.5
+    return format_price(cents, 'USD', is_from, period), cents, 'USD', int(is_from), period
+
+
+def generate_products(rng, count, categories, batch_size):
+    """
+    Yields batches of product rows for the products table. `categories` are
+    (id, slug, type) rows as inserted.
+    """
+    generated = [row for row in categories if row[2] != 'meta']
+    meta = [row for row in categories if row[1] in ('goods', 'services')]
+    # Rank order is shuffled so the biggest categories aren't simply the first ids
+    ranks = list(range(1, len(generated) + 1))
+    rng.shuffle(ranks)
+    weights = [1 / rank ** CATEGORY_SKEW for rank in ranks]
+
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        chosen = rng.choices(generated, weights=weights, k=size) if generated else [None] * size
+        batch = []
+        for category in chosen:
+            if category is None or rng.random() < META_PRODUCT_SHARE:
+                category = rng.choice(meta)
+            cat_id, slug, cat_type = category
+            cat_type = slug if cat_type == 'meta' else cat_type
+            noun = rng.choice(GOODS_NOUNS if cat_type == 'goods' else SERVICE_NOUNS)
+            name = f"{noun} {rng.choice(LINES)} {rng.randrange(1, 20)} {rng.choice(EDITIONS)}".rstrip()
+            batch.append((name, *random_price(rng, cat_type), rng.choice(IMAGES[cat_type]), cat_id))
+        yield batch
+
+
+# --- Bulk Load ---
+
+def bulk_load_objects(conn):
+    """The product/category indexes and triggers, as (type, name, sql) in creation order."""
+    return conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name IN ('products', 'categories') AND sql IS NOT NULL
+        ORDER BY rowid
+    ''').fetchall()
+
+
+def generate(database, products, categories, seed, batch_size=BATCH_SIZE):
+    """Creates `database` from scratch and fills it. Returns the number of products inserted."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    migrate(database, verbose=False)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(database, isolation_level=None)
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')  # 256 MB
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+    # Dropped for the load and recreated afterwards: building an index once
+    # over sorted data beats updating it per row, and the FTS/facet triggers
+    # are replaced by the single rebuild below
+    deferred = bulk_load_objects(conn)
+    for obj_type, name, _ in deferred:
+        conn.execute(f'DROP {obj_type.upper()} {name}')
+
+    start = time.perf_counter()
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO categories (name, slug, type) VALUES (?, ?, ?)',
+                     generate_categories(rng, categories))
+    conn.execute('COMMIT')
+    category_rows = conn.execute('SELECT id, slug, type FROM categories ORDER BY id').fetchall()
+
+    inserted = 0
+    for batch in generate_products(rng, products, category_rows, batch_size):
+        conn.execute('BEGIN')
+        conn.executemany('''
+            INSERT INTO products (name, price, price_cents, currency, price_is_from, billing_period, image_url, category_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+        conn.execute('COMMIT')
+        inserted += len(batch)
+        print(f"  {inserted}/{products} products", end='\r', flush=True)
+    print(f"Inserted {len(category_rows)} categories and {inserted} products in {time.perf_counter() - start:.1f}s.")
+
+    start = time.perf_counter()
+    for obj_type, name, sql in deferred:
+        conn.execute(sql)
+    # These are idempotent migrations: with their triggers already in place
+    # they just (re)build the FTS rows, the materialized counts and the
+    # change feed's revisions
+    create_search_index(conn, batch_size)
+    create_facet_counts(conn, batch_size)
+    create_change_feed(conn, batch_size)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    print(f"Built indexes, search index, facet counts and change feed in {time.perf_counter() - start:.1f}s.")
+    return inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic shop catalog.")
+    parser.add_argument('database', help="Output SQLite file (replaced if it exists)")
+    parser.add_argument('--products', type=int, default=100000, help="Number of products (default 100000)")
+    parser.add_argument('--categories', type=int, default=50, help="Number of non-meta categories (default 50)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed; same seed and sizes give the same data")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows per insert transaction")
+    args = parser.parse_args(argv)
+
+    if args.products < 0 or args.categories < 1:
+        parser.error("--products must be >= 0 and --categories >= 1")
+    generate(args.database, args.products, args.categories, args.seed, args.batch_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,461 @@
+# loadtest.py
+"""
+HTTP load generator and latency benchmark for both web apps:
+
+    shop  - the Flask shop in jobs/app.py (/shop, /api/*, /admin; read-only mix)
+    auth  - the FastAPI login backend in server/backend.py
+            (/login, /session, /, /logout with the CSRF double-submit flow)
+
+Only the standard library is used. Each virtual user is a thread with its
+own keep-alive connection and cookie jar. The report gives throughput and
+p50/p95/p99 latency per route. A run exits non-zero when more than
+--max-error-rate of its requests failed (a broken or throttling target
+measures nothing useful), and with --baseline also when latency or
+throughput regress by more than --tolerance against a stored run.
+
+The shop scenario needs an initialized jobs/database.db (python init_db.py).
+
+In the auth scenario each virtual user logs in as its own account
+(--username, default bench-{n} for user n) from its own client address
+(X-Real-IP, which the backend trusts from a loopback peer), like a crowd of
+real clients rather than one client hammering one account. Those accounts,
+and login rates far above the deployed limits, only exist in the load-test
+entry point bench/auth_bench_app.py, which --spawn runs; the deployed
+backend only knows the demo account.
+
+Examples (from the repository root):
+    python bench/loadtest.py shop --spawn --duration 20
+    python bench/loadtest.py auth --url http://127.0.0.1:8000 --concurrency 32
+    python bench/loadtest.py shop --spawn --save-baseline bench/baseline.json
+    python bench/loadtest.py shop --spawn --baseline bench/baseline.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_URLS = {'shop': 'http://127.0.0.1:5000', 'auth': 'http://127.0.0.1:8000'}
+
+# How to start each app for --spawn: (working directory, command, extra environment)
+SPAWN_COMMANDS = {
+    'shop': ('jobs', [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}', '--with-threads'], {}),
+    'auth': ('server', [sys.executable, '-m', 'uvicorn', '--app-dir', os.path.join(REPO_ROOT, 'bench'),
+                        'auth_bench_app:app', '--port', '{port}', '--log-level', 'warning'],
+             {'LOADTEST_AUTH_USERS': '{users}'}),
+}
+
+CSRF_COOKIE_NAME = "my_app_csrf_token"
+CSRF_TOKEN_HEADER = "X-CSRF-Token"
+
+SEARCH_TERMS = ['ip', 'iphone', 'mac', 'pro', 'apple watch', 'air', 'music', 'ipad mini']
+
+
+# --- HTTP Client ---
+
+class Client:
+    """A keep-alive HTTP connection with a minimal cookie jar (Secure flags are ignored for local runs)."""
+
+    def __init__(self, base_url, timeout=10, headers=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.timeout = timeout
+        self.headers = dict(headers or {})  # Sent with every request
+        self.conn = None
+        self.cookies = {}
+        self.last_headers = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Sends one request and returns (status, body bytes). Reconnects once if the server closed the connection."""
+        headers = dict(self.headers, **(headers or {}))
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                self.close()
+                if attempt == 2:
+                    raise
+                continue
+            self.last_headers = response.headers
+            self._store_cookies(response.headers.get_all('Set-Cookie') or [])
+            return response.status, data
+
+    def _store_cookies(self, set_cookie_headers):
+        for header in set_cookie_headers:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0' or not morsel.value.strip('"'):
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# --- Scenarios ---
+# A scenario is a class whose step() performs one request and returns
+# (route label, status, latency in seconds, ok?).
+
+def timed(client, label, method, path, expected=(200,), **kwargs):
+    start = time.perf_counter()
+    try:
+        status, body = client.request(method, path, **kwargs)
+    except (OSError, http.client.HTTPException):
+        return label, 0, time.perf_counter() - start, False, b''
+    return label, status, time.perf_counter() - start, status in expected, body
+
+
+class ShopUser:
+    """Browses the shop: listing pages, filters, keyset paging, search, autocomplete and the admin listing."""
+
+    # (weight, action name)
+    MIX = [(40, 'shop'), (15, 'shop_filtered'), (15, 'api_page'), (10, 'search'),
+           (12, 'autocomplete'), (3, 'admin'), (5, 'not_modified')]
+
+    def __init__(self, client, rng, context, index):
+        self.client, self.rng, self.context = client, rng, context
+        self.actions, self.weights = zip(*[(name, weight) for weight, name in self.MIX])
+        self.etag = None
+
+    @staticmethod
+    def prepare(base_url):
+        """Learns category slugs and a deep-page cursor from the running app."""
+        client = Client(base_url)
+        status, body = client.request('GET', '/api/products?limit=100')
+        client.close()
+        if status != 200:
+            raise RuntimeError(f"Shop is not answering /api/products (HTTP {status})")
+        page = json.loads(body)
+        slugs = sorted({p['category_slug'] for p in page['products']} | {'goods', 'services'})
+        return {'slugs': slugs, 'cursor': page.get('next_cursor')}
+
+    def step(self):
+        action = self.rng.choices(self.actions, self.weights)[0]
+        if action == 'shop':
+            label, status, latency, ok, _ = timed(self.client, 'GET /shop', 'GET', '/shop')
+        elif action == 'shop_filtered':
+            query = urlencode({'category': self.rng.choice(self.context['slugs']),
+                               'sort': self.rng.choice(['name', 'price', 'price_desc'])})
+            label, status, latency, ok, _ = timed(self.client, 'GET /shop?category', 'GET', f'/shop?{query}')
+        elif action == 'api_page':
+            params = {'limit': 24}
+            if self.context['cursor'] and self.rng.random() < 0.5:
+                params['after'] = self.context['cursor']
+            label, status, latency, ok, _ = timed(self.client, 'GET /api/products', 'GET', f'/api/products?{urlencode(params)}')
+        elif action == 'search':
+            query = urlencode({'q': self.rng.choice(SEARCH_TERMS)})
+            label, status, latency, ok, _ = timed(self.client, 'GET /api/search', 'GET', f'/api/search?{query}')
+        elif action == 'autocomplete':
+            query = urlencode({'q': self.rng.choice(SEARCH_TERMS)[:self.rng.randint(2, 4)]})
+            label, status, latency, ok, _ = timed(self.client, 'GET /api/autocomplete', 'GET', f'/api/autocomplete?{query}')
+        elif action == 'admin':
+            label, status, latency, ok, _ = timed(self.client, 'GET /admin', 'GET', '/admin')
+        else:
+            # Revalidation with the last ETag we saw, as a returning browser would
+            headers = {'If-None-Match': self.etag} if self.etag else {}
+            label, status, latency, ok, _ = timed(self.client, 'GET /shop (revalidate)', 'GET', '/shop',
+                                                  expected=(200, 304), headers=headers)
+            if ok and status == 200:
+                self.etag = self.client.last_headers.get('ETag')
+        return label, status, latency, ok
+
+
+class AuthUser:
+    """
+    Logs in, then mostly checks its session, with occasional root hits and
+    logouts (which send the CSRF cookie back in the X-CSRF-Token header).
+    A small share of logins use a wrong password. User n has its own
+    account and client address (see the module docstring).
+    """
+
+    MIX = [(80, 'session'), (10, 'root'), (6, 'logout'), (4, 'bad_login')]
+
+    def __init__(self, client, rng, context, index):
+        self.client, self.rng, self.context = client, rng, context
+        self.actions, self.weights = zip(*[(name, weight) for weight, name in self.MIX])
+        self.logged_in = False
+        self.username = context['username'].format(n=index)
+        self.client.headers['X-Real-IP'] = f'10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}'
+
+    @staticmethod
+    def prepare(base_url):
+        return {}
+
+    def step(self):
+        if not self.logged_in:
+            credentials = {'username': self.username, 'password': self.context['password']}
+            label, status, latency, ok, _ = timed(self.client, 'POST /login', 'POST', '/login', body=credentials)
+            self.logged_in = ok
+            return label, status, latency, ok
+
+        action = self.rng.choices(self.actions, self.weights)[0]
+        if action == 'session':
+            label, status, latency, ok, _ = timed(self.client, 'GET /session', 'GET', '/session')
+            self.logged_in = ok
+        elif action == 'root':
+            label, status, latency, ok, _ = timed(self.client, 'GET /', 'GET', '/')
+        elif action == 'bad_login':
+            credentials = {'username': self.username, 'password': 'wrong-password'}
+            # Use a throwaway client so our own session cookies survive
+            bad_client = Client(f'http://{self.client.host}:{self.client.port}', headers=self.client.headers)
+            label, status, latency, ok, _ = timed(bad_client, 'POST /login (bad)', 'POST', '/login',
+                                                  expected=(401, 429), body=credentials)
+            bad_client.close()
+        else:
+            headers = {CSRF_TOKEN_HEADER: self.client.cookies.get(CSRF_COOKIE_NAME, '')}
+            label, status, latency, ok, _ = timed(self.client, 'POST /logout', 'POST', '/logout', headers=headers)
+            self.logged_in = False
+        return label, status, latency, ok
+
+
+SCENARIOS = {'shop': ShopUser, 'auth': AuthUser}
+
+
+# --- Runner ---
+
+def run_load(scenario, base_url, concurrency, duration, warmup, seed, context):
+    """Runs `concurrency` virtual users for `duration` seconds; returns {route: [latencies]}, {route: errors}, elapsed."""
+    user_class = SCENARIOS[scenario]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def worker(index):
+        client = Client(base_url)
+        user = user_class(client, random.Random(seed * 1000 + index), context, index)
+        local_latencies, local_errors = defaultdict(list), defaultdict(int)
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            label, status, latency, ok = user.step()
+            if now < measure_from:
+                continue
+            if ok:
+                local_latencies[label].append(latency)
+            else:
+                local_errors[f'{label} -> {status or "connection error"}'] += 1
+        client.close()
+        with lock:
+            for label, values in local_latencies.items():
+                latencies[label].extend(values)
+            for label, count in local_errors.items():
+                errors[label] += count
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, duration
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Builds the report dict: per-route and overall count, rps and p50/p95/p99 in milliseconds."""
+    routes = {}
+    everything = []
+    for label, values in sorted(latencies.items()):
+        values.sort()
+        everything.extend(values)
+        routes[label] = {
+            'count': len(values),
+            'rps': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        }
+    everything.sort()
+    total = {
+        'count': len(everything),
+        'rps': round(len(everything) / elapsed, 1),
+        'p50_ms': round(percentile(everything, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(everything, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(everything, 0.99) * 1000, 2),
+        'errors': sum(errors.values()),
+    }
+    return {'total': total, 'routes': routes, 'errors': dict(errors)}
+
+
+def print_report(scenario, report):
+    print(f"\n=== {scenario}: {report['total']['count']} requests, {report['total']['rps']} req/s, "
+          f"{report['total']['errors']} errors ===")
+    print(f"{'route':32} {'count':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, stats in list(report['routes'].items()) + [('TOTAL', report['total'])]:
+        print(f"{label:32} {stats['count']:>8} {stats['rps']:>8} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    for label, count in sorted(report['errors'].items()):
+        print(f"  error: {label} x{count}")
+
+
+def compare_to_baseline(report, baseline, tolerance, min_ms):
+    """
+    Returns a list of regressions: p95/p99 latency above baseline * (1 + tolerance)
+    (ignoring differences below `min_ms`, which are noise), or throughput below
+    baseline * (1 - tolerance). Routes missing from either run are skipped.
+    """
+    regressions = []
+    pairs = [('TOTAL', report['total'], baseline['total'])]
+    pairs += [(label, stats, baseline['routes'][label])
+              for label, stats in report['routes'].items() if label in baseline.get('routes', {})]
+    for label, current, previous in pairs:
+        for metric in ('p95_ms', 'p99_ms'):
+            limit = previous[metric] * (1 + tolerance)
+            if current[metric] > limit and current[metric] - previous[metric] >= min_ms:
+                regressions.append(f"{label}: {metric} {current[metric]} > {previous[metric]} (+{tolerance:.0%} allowed)")
+    if report['total']['rps'] < baseline['total']['rps'] * (1 - tolerance):
+        regressions.append(f"TOTAL: throughput {report['total']['rps']} req/s < {baseline['total']['rps']} "
+                           f"(-{tolerance:.0%} allowed)")
+    return regressions
+
+
+# --- Spawning The Apps ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited early with code {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"App did not start listening on port {port} within {timeout}s")
+
+
+def spawn_app(scenario, users):
+    """Starts the app for `scenario` (ready for `users` virtual users) on a free local port; returns (process, base URL)."""
+    port = free_port()
+    workdir, command, env = SPAWN_COMMANDS[scenario]
+    command = [part.format(port=port) for part in command]
+    env = dict(os.environ, **{name: value.format(users=users) for name, value in env.items()})
+    process = subprocess.Popen(command, cwd=os.path.join(REPO_ROOT, workdir), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process, f'http://127.0.0.1:{port}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the shop (jobs/) or auth (server/) app.")
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--url', help="Base URL of a running app (default: per scenario)")
+    parser.add_argument('--spawn', action='store_true', help="Start the app locally on a free port for the run")
+    parser.add_argument('--concurrency', type=int, default=16, help="Virtual users (threads)")
+    parser.add_argument('--duration', type=float, default=15.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before measuring")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the request mix")
+    parser.add_argument('--username', default='bench-{n}',
+                        help="Auth account; {n} is replaced by the virtual user's number (default: bench-{n})")
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--json', metavar='PATH', help="Also write the report as JSON")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Store this run as the baseline for the scenario")
+    parser.add_argument('--baseline', metavar='PATH', help="Fail if this run regresses against the stored baseline")
+    parser.add_argument('--tolerance', type=float, default=0.20, help="Allowed regression as a fraction (default 0.20)")
+    parser.add_argument('--min-ms', type=float, default=1.0, help="Ignore latency differences smaller than this")
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help="Fail if more than this fraction of requests failed (default 0.01)")
+    args = parser.parse_args(argv)
+
+    process = None
+    base_url = args.url or DEFAULT_URLS[args.scenario]
+    if args.spawn:
+        process, base_url = spawn_app(args.scenario, args.concurrency)
+    try:
+        context = SCENARIOS[args.scenario].prepare(base_url)
+        context.update(username=args.username, password=args.password)
+        print(f"Running '{args.scenario}' against {base_url}: {args.concurrency} users, "
+              f"{args.warmup}s warmup + {args.duration}s measured")
+        latencies, errors, elapsed = run_load(args.scenario, base_url, args.concurrency,
+                                              args.duration, args.warmup, args.seed, context)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = summarize(latencies, errors, elapsed)
+    report['config'] = {'concurrency': args.concurrency, 'duration': args.duration, 'seed': args.seed}
+    print_report(args.scenario, report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    attempted = report['total']['count'] + report['total']['errors']
+    error_rate = report['total']['errors'] / attempted if attempted else 1.0
+    if error_rate > args.max_error_rate:
+        # Checked before saving: a run that mostly failed must not become the baseline
+        print(f"\nFAILED: {error_rate:.1%} of {attempted} requests failed "
+              f"(--max-error-rate {args.max_error_rate:.1%})", file=sys.stderr)
+        return 1
+
+    # Baseline files hold one entry per scenario, so shop and auth can share a file
+    if args.save_baseline:
+        stored = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline, encoding='utf-8') as f:
+                stored = json.load(f)
+        stored[args.scenario] = report
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f"Saved baseline for '{args.scenario}' to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f).get(args.scenario)
+        if baseline is None:
+            print(f"No baseline for '{args.scenario}' in {args.baseline}", file=sys.stderr)
+            return 2
+        regressions = compare_to_baseline(report, baseline, args.tolerance, args.min_ms)
+        if regressions:
+            print("\nREGRESSIONS against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+# querybench.py
+"""
+SQL microbenchmarks for the shop's production queries, with query-plan
+reporting, run against a database built by generate_catalog.py.
+
+The queries are not copied here: each scenario requests a real shop/admin
+URL through Flask's test client with app.record_query hooked, which
+captures every statement (and its arguments) exactly as the app issues it.
+Each captured statement is then re-run directly on a read-only connection
+(tuned like the app's pool) for --repeat timed runs, and its plan is read
+with EXPLAIN QUERY PLAN.
+
+The report flags:
+    FULL SCAN  - a plain table scan (no index) of a table with at least
+                 --scan-rows rows; an index is missing or can't be used
+    TEMP SORT  - the plan sorts in a temp b-tree (fine for a few rows,
+                 a problem when it sorts every matching product); in a
+                 product listing, which must page straight off an index,
+                 it is reported as "TEMP SORT of a listing"
+With --baseline it also reports plan changes and median times that grew
+by more than --tolerance. It exits non-zero on any full scan, sorted
+listing, plan change or slowdown.
+
+Examples (from the repository root):
+    python bench/generate_catalog.py bench/catalog-1m.db --products 1000000 --categories 200
+    python bench/querybench.py bench/catalog-1m.db --save-baseline bench/query-baseline.json
+    python bench/querybench.py bench/catalog-1m.db --baseline bench/query-baseline.json
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DIR = os.path.join(REPO_ROOT, 'jobs')
+
+SEARCH_OFFSET = 960  # Near MAX_SEARCH_OFFSET: the deepest search page the app serves
+
+
+# --- Scenarios ---
+
+def dataset_facts(conn):
+    """Values from the dataset the scenarios need: real slugs, a deep cursor, search words."""
+    total = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+    if total == 0:
+        raise SystemExit("The database has no products; build one with generate_catalog.py first.")
+    by_size = conn.execute('''
+        SELECT c.slug FROM categories c JOIN category_counts cc ON cc.category_id = c.id
+        WHERE c.type != 'meta' AND cc.product_count > 0
+        ORDER BY cc.product_count DESC, c.id
+    ''').fetchall()
+    deep_name, deep_id = conn.execute('SELECT name, id FROM products ORDER BY name, id LIMIT 1 OFFSET ?',
+                                      (total * 9 // 10,)).fetchone()
+    deep_price, deep_price_id = conn.execute(
+        'SELECT price_cents, id FROM products ORDER BY price_cents, id LIMIT 1 OFFSET ?',
+        (total * 9 // 10,)).fetchone()
+    # A common word (the first word of the middle product) and a rarer two-word phrase
+    middle_name = conn.execute('SELECT name FROM products WHERE id >= ? ORDER BY id LIMIT 1',
+                               (total // 2,)).fetchone()[0]
+    words = re.findall(r'\w+', middle_name)
+    latest_revision = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'catalog_changes'").fetchone()[0]
+    return {
+        'products': total,
+        'largest_category': by_size[0][0],
+        'smallest_category': by_size[-1][0],
+        'deep_name_cursor': (deep_name, deep_id),
+        'deep_price_cursor': (deep_price, deep_price_id),
+        'common_word': words[0],
+        'phrase': ' '.join(words[:2]),
+        'prefix': words[0][:2].lower(),
+        'recent_revision': max(0, latest_revision - 100),
+    }
+
+
+def build_scenarios(facts, encode_cursor):
+    """
+    (label, URL, listing?) for every read path of the shop and admin pages.
+    A listing pages through products in a fixed order, which an index has to
+    deliver: sorting every matching product for one page doesn't scale.
+    """
+    big, small = facts['largest_category'], facts['smallest_category']
+    return [
+        ('shop_all', '/shop', True),
+        ('shop_category_large', f'/shop?category={big}', True),
+        ('shop_category_small', f'/shop?category={small}', True),
+        ('shop_meta_goods', '/shop?category=goods', True),
+        ('shop_meta_services', '/shop?category=services', True),
+        ('shop_sort_price', '/shop?sort=price', True),
+        ('shop_sort_price_desc_category', f'/shop?category={big}&sort=price_desc', True),
+        # Without ?sort= a price range is listed in price order
+        ('shop_price_range', '/shop?min_price=100&max_price=200', True),
+        ('shop_price_range_wide', '/shop?min_price=0&max_price=1000000', True),
+        # An explicit name order walks the name index with the range as a filter: cheap for
+        # a wide range, slowest for a narrow one (few rows qualify per index entry read)
+        ('shop_price_range_wide_name', '/shop?min_price=0&max_price=1000000&sort=name', True),
+        ('shop_price_range_narrow_name', '/shop?min_price=100&max_price=101&sort=name', True),
+        ('shop_price_range_meta', '/shop?category=services&min_price=5&max_price=10&sort=price', True),
+        ('shop_deep_cursor', f'/shop?after={encode_cursor(*facts["deep_name_cursor"])}', True),
+        ('shop_deep_cursor_price', f'/shop?sort=price&after={encode_cursor(*facts["deep_price_cursor"])}', True),
+        # Search results are ranked by relevance: sorting the matches is expected
+        ('shop_search_common', f'/shop?q={facts["common_word"]}', False),
+        ('api_search_phrase', f'/api/search?q={facts["phrase"]}', False),
+        ('api_search_deep_offset', f'/api/search?q={facts["common_word"]}&offset={SEARCH_OFFSET}&limit=40', False),
+        ('api_autocomplete', f'/api/autocomplete?q={facts["prefix"]}', False),
+        ('api_changes_full', '/api/changes?since=0', False),
+        ('api_changes_recent', f'/api/changes?since={facts["recent_revision"]}', False),
+        ('admin', '/admin', True),
+        ('admin_category_price', f'/admin?category={big}&sort=price', True),
+        ('admin_search', f'/admin?q={facts["common_word"]}', False),
+    ]
+
+
+def capture_statements(app_module, scenarios):
+    """
+    Requests each scenario URL and returns [(label, sql, args, listing?)] for
+    every statement it ran, in order. Statements already captured by an earlier
+    scenario (same SQL and arguments, e.g. the facet queries) are skipped.
+    """
+    captured, seen = [], set()
+    current = {}
+    original = app_module.record_query
+
+    def capturing_record_query(sql, elapsed, args=()):
+        key = (sql, tuple(args))
+        if key not in seen:
+            seen.add(key)
+            current['statements'].append((sql, list(args)))
+        original(sql, elapsed, args)
+
+    app_module.record_query = capturing_record_query
+    try:
+        client = app_module.app.test_client()
+        for label, url, listing in scenarios:
+            current['statements'] = []
+            response = client.get(url)
+            if response.status_code != 200:
+                raise SystemExit(f"{label}: GET {url} returned {response.status_code}")
+            for number, (sql, args) in enumerate(current['statements'], 1):
+                captured.append((f'{label}#{number}', sql, args, listing))
+    finally:
+        app_module.record_query = original
+    return captured
+
+
+# --- Measuring ---
+
+def table_aliases(sql):
+    """Maps the names a plan may use for each table (alias or table name) to the table name."""
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.upper() not in ('ON', 'WHERE', 'JOIN', 'LEFT', 'INNER', 'ORDER', 'GROUP', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+
+def query_plan(conn, sql, args):
+    """EXPLAIN QUERY PLAN as indented lines, one per plan step."""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', args).fetchall()
+    depth = {0: -1}
+    lines = []
+    for step_id, parent, _, detail in rows:
+        depth[step_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[step_id] + detail)
+    return lines
+
+
+def plan_flags(plan, sql, table_rows, scan_rows, listing=False):
+    """
+    Problems visible in a plan: full scans of large tables and temp b-tree
+    sorts, the latter marked "of a listing" when `listing` and the statement
+    reads products (the category list of a listing page sorts a few rows).
+    """
+    flags = []
+    aliases = table_aliases(sql)
+    listing = listing and 'products' in aliases.values()
+    for line in plan:
+        match = re.match(r'\s*SCAN (\w+)(.*)', line)
+        if match and 'INDEX' not in match.group(2) and 'VIRTUAL TABLE' not in match.group(2):
+            table = aliases.get(match.group(1), match.group(1))
+            if table_rows.get(table, 0) >= scan_rows:
+                flags.append(f'FULL SCAN {table} ({table_rows[table]} rows)')
+        if 'USE TEMP B-TREE' in line:
+            flags.append(('TEMP SORT of a listing: ' if listing else 'TEMP SORT: ')
+                         + line.strip()[len('USE TEMP B-TREE '):])
+    return flags
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def time_statement(conn, sql, args, repeat):
+    """Runs the statement `repeat` times (after one warm-up run). Returns (median ms, p95 ms, rows)."""
+    rows = len(conn.execute(sql, args).fetchall())
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, args).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return round(percentile(timings, 0.5), 3), round(percentile(timings, 0.95), 3), rows
+
+
+def run_benchmarks(database, repeat, scan_rows):
+    os.environ['SHOP_DATABASE'] = os.path.abspath(database)
+    os.environ['SHOP_MIGRATE_ON_START'] = '0'  # Benchmark the file as it is
+    sys.path.insert(0, JOBS_DIR)
+    import app as app_module
+    from db_pool import DEFAULT_PRAGMAS
+    from metrics import normalize_sql
+
+    conn = sqlite3.connect(f'file:{os.path.abspath(database)}?mode=ro', uri=True)
+    for name, value in DEFAULT_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    try:
+        facts = dataset_facts(conn)
+        table_rows = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                      if not table.startswith('products_fts')}
+        statements = capture_statements(app_module, build_scenarios(facts, app_module.encode_cursor))
+        results = {}
+        for key, sql, args, listing in statements:
+            plan = query_plan(conn, sql, args)
+            median_ms, p95_ms, rows = time_statement(conn, sql, args, repeat)
+            results[key] = {
+                'statement': normalize_sql(sql),
+                'args': args,
+                'median_ms': median_ms,
+                'p95_ms': p95_ms,
+                'rows': rows,
+                'plan': plan,
+                'flags': plan_flags(plan, sql, table_rows, scan_rows, listing),
+            }
+    finally:
+        conn.close()
+    return {'dataset': {'products': facts['products'], 'categories': table_rows.get('categories', 0)},
+            'config': {'repeat': repeat}, 'queries': results}
+
+
+# --- Reporting ---
+
+def print_report(report, verbose):
+    dataset = report['dataset']
+    print(f"\n=== {len(report['queries'])} statements on {dataset['products']} products, "
+          f"{dataset['categories']} categories ===")
+    print(f"{'query':40} {'median ms':>10} {'p95 ms':>9} {'rows':>6}  statement")
+    for key, result in report['queries'].items():
+        print(f"{key:40} {result['median_ms']:>10} {result['p95_ms']:>9} {result['rows']:>6}  "
+              f"{result['statement'][:70]}")
+        for flag in result['flags']:
+            print(f"{'':42}! {flag}")
+        if verbose:
+            for line in result['plan']:
+                print(f"{'':44}{line}")
+
+
+def compare_to_baseline(report, baseline, tolerance, min_ms):
+    """
+    Returns a list of differences from the baseline: changed plans (or
+    statements), and median times above baseline * (1 + tolerance) that also
+    grew by at least `min_ms`. Queries missing from either run are listed too.
+    """
+    changes = []
+    current, previous = report['queries'], baseline['queries']
+    if report['dataset'] != baseline['dataset']:
+        changes.append(f"dataset differs from the baseline's: {report['dataset']} vs {baseline['dataset']}")
+    for key in sorted(set(previous) - set(current)):
+        changes.append(f"{key}: no longer run (was: {previous[key]['statement'][:80]})")
+    for key, result in current.items():
+        before = previous.get(key)
+        if before is None:
+            changes.append(f"{key}: new statement, not in the baseline")
+            continue
+        if result['statement'] != before['statement']:
+            changes.append(f"{key}: statement changed\n      was: {before['statement']}\n      now: {result['statement']}")
+        elif result['plan'] != before['plan']:
+            changes.append(f"{key}: plan changed\n      was: " + '\n           '.join(before['plan'])
+                           + "\n      now: " + '\n           '.join(result['plan']))
+        limit = before['median_ms'] * (1 + tolerance)
+        if result['median_ms'] > limit and result['median_ms'] - before['median_ms'] >= min_ms:
+            changes.append(f"{key}: median {result['median_ms']} ms > {before['median_ms']} ms "
+                           f"(+{tolerance:.0%} allowed)")
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the shop's SQL statements and report their query plans.")
+    parser.add_argument('database', help="Database built by generate_catalog.py (opened read-only)")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per statement (default 20)")
+    parser.add_argument('--scan-rows', type=int, default=10000,
+                        help="Flag full scans of tables with at least this many rows (default 10000)")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Print every query plan")
+    parser.add_argument('--json', metavar='PATH', help="Also write the report as JSON")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Store this run as the baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="Fail on plan changes or slowdowns against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.50, help="Allowed slowdown as a fraction (default 0.50)")
+    parser.add_argument('--min-ms', type=float, default=0.5, help="Ignore time differences smaller than this")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} does not exist; build it with generate_catalog.py")
+    report = run_benchmarks(args.database, args.repeat, args.scan_rows)
+    print_report(report, args.verbose)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+    if args.save_baseline:
+        print(f"Saved baseline to {args.save_baseline}")
+
+    status = 0
+    full_scans = [key for key, result in report['queries'].items()
+                  if any(flag.startswith('FULL SCAN') for flag in result['flags'])]
+    if full_scans:
+        print(f"\nFULL SCANS in: {', '.join(full_scans)}")
+        status = 1
+    sorted_listings = [key for key, result in report['queries'].items()
+                       if any(flag.startswith('TEMP SORT of a listing') for flag in result['flags'])]
+    if sorted_listings:
+        print(f"\nLISTINGS SORTED IN A TEMP B-TREE in: {', '.join(sorted_listings)}")
+        status = 1
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        changes = compare_to_baseline(report, baseline, args.tolerance, args.min_ms)
+        if changes:
+            print("\nCHANGES against baseline:")
+            for line in changes:
+                print(f"  {line}")
+            status = 1
+        else:
+            print("\nNo plan changes or slowdowns against baseline.")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
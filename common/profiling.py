@@ -0,0 +1,258 @@
+# profiling.py
+"""
+On-demand sampling profiler shared by the shop (jobs/app.py, requests keyed
+by thread) and the auth backend (server/backend.py, keyed by asyncio task).
+"""
+import asyncio
+import json
+import os
+import pstats
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_INTERVAL = 0.005      # Seconds between stack samples (200 Hz)
+DEFAULT_SECONDS = 30          # Length of a profile started by signal without a config file
+MAX_PROFILE_SECONDS = 600     # A profile left running stops itself after this
+MAX_STACK_DEPTH = 100         # Innermost frames kept per sample
+MAX_STACKS_PER_ROUTE = 20000  # Distinct stacks kept per route; further ones are counted as OTHER_FRAME
+OTHER_FRAME = ("~", 0, "[other stacks]")
+
+
+class _SampledStats:
+    """What pstats.Stats expects from a profiler object: a ready `stats` dict."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for web requests: while enabled, a background thread
+    reads the Python stack of every request in progress every `interval`
+    seconds (sys._current_frames) and counts identical stacks per route.
+    Nothing is traced, so a profiled request runs at full speed, and while
+    disabled the only cost is the request hooks checking `enabled`.
+
+    Requests are registered by the app with enter()/exit(), keyed by thread
+    id (threaded servers) or by asyncio task (see watch_event_loop). Results
+    come out as flamegraph-ready collapsed stacks or as pstats data, where
+    times are sample counts * interval and "calls" count samples.
+
+    Each worker process has its own profiler.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, output_dir: Optional[str] = None):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.enabled = False  # Read on every request; keep it a plain attribute
+        self.sample_rate = 1.0
+        self.routes = None
+        self.started_at = None
+        self.deadline = None
+        self.samples = 0
+        self._requests = {}  # thread id or asyncio task -> route label
+        self._loops = {}     # thread id -> event loop whose current task is the request running there
+        self._stacks = defaultdict(Counter)  # route -> {stack (outermost frame first): samples}
+        self._lock = threading.Lock()
+        self._control_lock = threading.Lock()  # Serializes start()/stop()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Request Hooks ---
+
+    def should_profile(self, route: str) -> bool:
+        """Whether to profile a request for `route` (call only while enabled)."""
+        if self.routes is not None and route not in self.routes:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def enter(self, key, label):
+        self._requests[key] = label
+
+    def exit(self, key):
+        self._requests.pop(key, None)
+
+    def watch_event_loop(self, loop):
+        """Attributes samples of the calling thread to the task `loop` is running (call from the loop's thread)."""
+        self._loops[threading.get_ident()] = loop
+
+    # --- Control ---
+
+    def start(self, sample_rate: float = 1.0, seconds: Optional[float] = None,
+              routes: Optional[Iterable[str]] = None) -> bool:
+        """
+        Starts a fresh profile of `sample_rate` of the requests (to `routes`
+        only, if given) for `seconds` (at most MAX_PROFILE_SECONDS).
+        Returns False if a profile is already running.
+        """
+        with self._control_lock:
+            if self.enabled:
+                return False
+            seconds = min(seconds or MAX_PROFILE_SECONDS, MAX_PROFILE_SECONDS)
+            with self._lock:
+                self._stacks = defaultdict(Counter)
+                self.samples = 0
+            self.sample_rate = sample_rate
+            self.routes = set(routes) if routes else None
+            self.started_at = time.time()
+            self.deadline = time.monotonic() + seconds
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+            self.enabled = True
+            return True
+
+    def stop(self) -> List[str]:
+        """Stops the running profile and, with an output_dir, writes it out. Returns the files written."""
+        with self._control_lock:
+            if not self.enabled:
+                return []
+            self.enabled = False
+            self._stop.set()
+            self._thread.join()
+            self._requests.clear()
+        return self.dump() if self.output_dir else []
+
+    def toggle(self, config_path: Optional[str] = None) -> List[str]:
+        """
+        Stops a running profile, or starts one with the settings in the JSON
+        file at `config_path` (re-read every time), e.g.
+        {"sample_rate": 0.1, "seconds": 60, "routes": ["/shop"]}.
+        """
+        if self.enabled:
+            return self.stop()
+        settings = {}
+        if config_path and os.path.exists(config_path):
+            with open(config_path, encoding="utf-8") as f:
+                settings = json.load(f)
+        self.start(sample_rate=float(settings.get("sample_rate", 1.0)),
+                   seconds=float(settings.get("seconds", DEFAULT_SECONDS)),
+                   routes=settings.get("routes"))
+        return []
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= self.deadline:
+                # stop() joins this thread, so it has to run on another one
+                threading.Thread(target=self.stop, name="profiler-stop", daemon=True).start()
+                return
+            self._sample()
+
+    def _sample(self):
+        taken = []
+        for ident, frame in sys._current_frames().items():
+            loop = self._loops.get(ident)
+            label = self._requests.get(ident if loop is None else asyncio.current_task(loop))
+            if label is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            stack.reverse()
+            taken.append((label, tuple(stack)))
+        with self._lock:
+            self.samples += 1
+            for label, stack in taken:
+                counts = self._stacks[label]
+                if stack not in counts and len(counts) >= MAX_STACKS_PER_ROUTE:
+                    stack = (OTHER_FRAME,)
+                counts[stack] += 1
+
+    # --- Results ---
+
+    def _snapshot(self, route=None):
+        with self._lock:
+            return {label: Counter(counts) for label, counts in self._stacks.items()
+                    if route is None or label == route}
+
+    def status(self) -> Dict:
+        with self._lock:
+            per_route = {label: sum(counts.values()) for label, counts in self._stacks.items()}
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "routes": sorted(self.routes) if self.routes else None,
+            "interval": self.interval,
+            "started_at": self.started_at,
+            "seconds_left": round(max(0.0, self.deadline - time.monotonic()), 1) if self.enabled else 0,
+            "ticks": self.samples,
+            "samples": per_route,
+        }
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """Stacks in collapsed format ("route;outer;...;inner count" per line), for flamegraph.pl or speedscope."""
+        lines = []
+        for label, counts in sorted(self._snapshot(route).items()):
+            for stack, count in counts.most_common():
+                frames = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+                lines.append(f"{label};{frames} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def pstats(self, route: Optional[str] = None) -> pstats.Stats:
+        """The samples of `route` (or all routes) as a pstats.Stats, to sort, print or dump_stats()."""
+        stats = {}
+        for counts in self._snapshot(route).values():
+            for stack, count in counts.items():
+                seconds = count * self.interval
+                seen = set()
+                for depth, func in enumerate(stack):
+                    entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                    innermost = depth == len(stack) - 1
+                    if func not in seen:  # A recursive function's cumulative time counts once per sample
+                        seen.add(func)
+                        entry[0] += count
+                        entry[1] += count
+                        entry[3] += seconds
+                    if innermost:
+                        entry[2] += seconds
+                    if depth:
+                        cc, nc, tt, ct = entry[4].get(stack[depth - 1], (0, 0, 0.0, 0.0))
+                        entry[4][stack[depth - 1]] = (cc + count, nc + count,
+                                                      tt + (seconds if innermost else 0.0), ct + seconds)
+        return pstats.Stats(_SampledStats({func: tuple(entry) for func, entry in stats.items()}))
+
+    def dump(self, directory: Optional[str] = None) -> List[str]:
+        """Writes <route>.collapsed and <route>.pstats per route to a new timestamped directory. Returns the paths."""
+        directory = os.path.join(directory or self.output_dir,
+                                 time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}")
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for label in sorted(self._snapshot()):
+            name = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_") or "root"
+            path = os.path.join(directory, f"{name}.collapsed")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.collapsed(label))
+            paths.append(path)
+            path = os.path.join(directory, f"{name}.pstats")
+            self.pstats(label).dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+def install_signal_handler(profiler: SamplingProfiler, config_path: Optional[str] = None,
+                           signum=getattr(signal, "SIGUSR2", None)) -> bool:
+    """
+    Makes `signum` (SIGUSR2) toggle `profiler`, re-reading `config_path`
+    each time. The work runs in a new thread: the handler interrupts
+    whatever the main thread was doing, which may hold the profiler's locks.
+    Only possible from the main thread; returns whether it was installed.
+    """
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handle(signum, frame):
+        threading.Thread(target=profiler.toggle, args=(config_path,), name="profiler-toggle", daemon=True).start()
+
+    signal.signal(signum, handle)
+    return True
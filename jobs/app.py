@@ -1,35 +1,176 @@
 # app.py
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import json
+import marshal
+import math
+import os
+import re
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, g, flash, abort
+import sys
+import threading
+import time
+from flask import (Flask, Response, render_template, request, redirect, url_for, g, flash, abort,
+                   jsonify, make_response, send_file, send_from_directory, session)
 
-DATABASE = 'database.db'
+from build_assets import DIST_DIR, MANIFEST_PATH
+from catalog_cache import CatalogCache, CachedResponse
+from catalog_io import FORMATS, ImportReport, detect_format, export_products, import_products
+from db_pool import ConnectionPool
+from image_cache import VARIANT_WIDTHS, ImageVariantCache, resizing_available
+from migrations import migrate
+from pricing import parse_amount, parse_price, format_price
+
+# metrics.py and profiling.py are shared with the auth backend and live in common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from metrics import PROMETHEUS_CONTENT_TYPE, Counter, Histogram, Registry, normalize_sql  # noqa: E402
+from profiling import SamplingProfiler, install_signal_handler  # noqa: E402
+
+# Not in git: `python init_db.py` creates it, migrated and with the demo catalog
+DATABASE = os.environ.get('SHOP_DATABASE', 'database.db')
+
+PAGE_SIZE = 8        # Products per shop page (matches the old client-side pagination)
+MAX_PAGE_SIZE = 100  # Upper bound for the ?limit= parameter of the JSON API
+ADMIN_PAGE_SIZE = 50  # Products per admin dashboard page
+SEARCH_PAGE_SIZE = 48        # Results shown for a search on the shop page
+MAX_SEARCH_OFFSET = 1000     # Ranked results past this are not worth paging into
+AUTOCOMPLETE_MIN_CHARS = 2   # Matches products_fts prefix='2 3'; shorter prefixes would scan
+AUTOCOMPLETE_LIMIT = 8
+CHANGES_PAGE_SIZE = 500      # Changes per /api/changes response (and per SSE poll)
+MAX_CHANGES_PAGE_SIZE = 5000
 
 app = Flask(__name__)
 # Secret key needed for flashing messages
 app.secret_key = b'_5#y2L"F4Q8z\n\xec]/' # Change this to a random secret key
 
+# Rendered shop/API responses, invalidated whenever the catalog's revision changes
+catalog_cache = CatalogCache()
+
+# --- Metrics ---
+# Request and SQL timings, exposed in Prometheus text format on /metrics.
+# Recording is a couple of integer adds; formatting only happens on scrape.
+
+SLOW_QUERY_SECONDS = float(os.environ.get('SHOP_SLOW_QUERY_MS', '100')) / 1000
+
+metrics_registry = Registry()
+request_duration = metrics_registry.register(Histogram(
+    'shop_request_duration_seconds', 'Time spent handling HTTP requests, per route.',
+    ('method', 'route', 'status')))
+query_duration = metrics_registry.register(Histogram(
+    'shop_query_duration_seconds', 'Time spent executing SQL statements, per statement.',
+    ('statement',)))
+slow_queries = metrics_registry.register(Counter(
+    'shop_slow_queries_total', 'SQL statements slower than SHOP_SLOW_QUERY_MS.',
+    ('statement',)))
+
+def record_query(sql, elapsed, args=()):
+    """Feeds the per-statement histogram and logs the statement if it was slow."""
+    statement = normalize_sql(sql)
+    query_duration.observe((statement,), elapsed)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        slow_queries.inc((statement,))
+        app.logger.warning("Slow query (%.1f ms): %s Args: %r", elapsed * 1000, statement, args)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose execute()/executemany() calls are timed by record_query (used for writes)."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Label by URL rule, not path, so /images/320/x.jpg and /images/640/y.jpg share a series
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_duration.observe((request.method, route, str(response.status_code)), time.perf_counter() - start)
+    return response
+
+# --- Profiling ---
+# An on-demand sampling profiler (profiling.py) for looking inside a slow
+# route in production. Off by default, when the hooks below cost one
+# attribute check. Switch it on per worker with SIGUSR2 (toggles; re-reads
+# SHOP_PROFILE_CONFIG each time) or through /admin/profile (needs
+# SHOP_PROFILE_TOKEN). Finished profiles are written to SHOP_PROFILE_DIR.
+
+PROFILE_TOKEN = os.environ.get('SHOP_PROFILE_TOKEN')
+profiler = SamplingProfiler(output_dir=os.environ.get('SHOP_PROFILE_DIR', os.path.join(app.root_path, 'profiles')))
+install_signal_handler(profiler, os.environ.get('SHOP_PROFILE_CONFIG'))
+
+@app.before_request
+def start_request_profile():
+    if profiler.enabled and request.url_rule is not None and profiler.should_profile(request.url_rule.rule):
+        g.profiled_thread = threading.get_ident()
+        profiler.enter(g.profiled_thread, request.url_rule.rule)
+
+@app.teardown_request
+def end_request_profile(error):
+    thread_id = g.pop('profiled_thread', None)
+    if thread_id is not None:
+        profiler.exit(thread_id)
+
+
 # --- Database Helper Functions ---
+# Connections are pooled for the life of the process instead of being opened
+# per request. Shop reads use read-only connections; only the admin routes
+# take a read-write one (see db_pool.py for the pragmas applied).
+
+# Bring the schema up to date before serving (set SHOP_MIGRATE_ON_START=0 to run
+# `python migrations.py` as a separate deploy step instead)
+if os.environ.get('SHOP_MIGRATE_ON_START', '1') != '0':
+    migrate(DATABASE)
+
+write_pool = ConnectionPool(DATABASE, factory=InstrumentedConnection)
+read_pool = ConnectionPool(DATABASE, readonly=True)
+
 def get_db():
-    """Opens a new database connection if there is none yet for the current application context."""
+    """Checks out a read-write connection for the current application context."""
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        # Return rows as dictionary-like objects
-        g.db.row_factory = sqlite3.Row
+        g.db = write_pool.acquire()
     return g.db
 
+def get_read_db():
+    """Checks out a read-only connection for the current application context."""
+    if 'read_db' not in g:
+        g.read_db = read_pool.acquire()
+    return g.read_db
+
 @app.teardown_appcontext
 def close_db(error):
-    """Closes the database again at the end of the request."""
+    """Returns the request's connections to their pools at the end of the request."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        write_pool.release(db)
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        read_pool.release(read_db)
 
 def query_db(query, args=(), one=False):
-    """Queries the database and returns results."""
+    """Queries the database (through a read-only connection) and returns results."""
     try:
-        cur = get_db().execute(query, args)
+        start = time.perf_counter()
+        cur = get_read_db().execute(query, args)
         rv = cur.fetchall()
         cur.close()
+        record_query(query, time.perf_counter() - start, args)
         # Return None if no rows found, or the single row if 'one' is True
         return (rv[0] if rv else None) if one else rv
     except sqlite3.Error as e:
@@ -40,6 +181,408 @@ def query_db(query, args=(), one=False):
         return None # Or handle differently
 
 
+# --- Static Assets ---
+# build_assets.py writes content-hashed copies of static/css and
+# static/js (plus .gz variants) to static/dist and a manifest of their names.
+# Hashed files never change, so they are served with year-long immutable
+# caching; without a build we fall back to the plain static files.
+
+ASSET_MAX_AGE = 31536000  # One year, in seconds
+
+asset_manifest = {}
+asset_manifest_mtime = None
+
+def load_asset_manifest():
+    """(Re)loads static/dist/manifest.json if it changed; a missing manifest means no build yet."""
+    global asset_manifest, asset_manifest_mtime
+    try:
+        mtime = os.stat(MANIFEST_PATH).st_mtime
+    except OSError:
+        asset_manifest, asset_manifest_mtime = {}, None
+        return asset_manifest
+    if mtime != asset_manifest_mtime:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            asset_manifest = json.load(f)
+        asset_manifest_mtime = mtime
+    return asset_manifest
+
+load_asset_manifest()
+
+@app.template_global()
+def asset_url(filename):
+    """URL for a static asset: its fingerprinted build if there is one, else the plain file."""
+    manifest = load_asset_manifest() if app.debug else asset_manifest
+    hashed = manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('hashed_static', filename=hashed[len('dist/'):])
+
+@app.route('/static/dist/<path:filename>')
+def hashed_static(filename):
+    """Serves a fingerprinted asset, preferring its precompressed .gz variant."""
+    mimetype = {'.css': 'text/css', '.js': 'text/javascript'}.get(os.path.splitext(filename)[1])
+    if mimetype is None:
+        abort(404)
+    if request.accept_encodings['gzip'] and os.path.isfile(os.path.join(DIST_DIR, filename + '.gz')):
+        response = send_from_directory(DIST_DIR, filename + '.gz', mimetype=mimetype, max_age=ASSET_MAX_AGE)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+# --- Product Images ---
+# Shop cards request resized variants (via srcset) instead of the full-size
+# originals under static/images. Variants are rendered once and kept in a
+# size-bounded on-disk LRU cache (see image_cache.py). Needs Pillow; without
+# it the templates simply keep using the original URLs.
+
+IMAGE_URL_PREFIX = '/static/images/'
+IMAGE_CACHE_DIR = os.path.join(app.root_path, 'image_cache')
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_MAX_AGE = 86400  # Variant URLs aren't fingerprinted, so revalidate daily
+DEFAULT_IMAGE_WIDTH = 320
+
+image_cache = None
+if resizing_available():
+    image_cache = ImageVariantCache(os.path.join(app.static_folder, 'images'),
+                                    IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+@app.context_processor
+def inject_image_widths():
+    # Lets shop.js build the same srcset for cards it renders itself
+    return {'image_variant_widths': VARIANT_WIDTHS if image_cache is not None else ()}
+
+@app.template_global()
+def image_variant_url(image_url, width=DEFAULT_IMAGE_WIDTH):
+    """URL of a resized variant of a product image, or the original if we can't resize it."""
+    if image_cache is None or not image_url.startswith(IMAGE_URL_PREFIX):
+        return image_url
+    return url_for('product_image', width=width, filename=image_url[len(IMAGE_URL_PREFIX):])
+
+@app.template_global()
+def image_srcset(image_url):
+    """srcset attribute value offering every variant width, or '' if resizing is unavailable."""
+    if image_cache is None or not image_url.startswith(IMAGE_URL_PREFIX):
+        return ''
+    return ', '.join(f'{image_variant_url(image_url, width)} {width}w' for width in VARIANT_WIDTHS)
+
+@app.route('/images/<int:width>/<path:filename>')
+def product_image(width, filename):
+    """Serves static/images/<filename> resized to one of VARIANT_WIDTHS, as WebP when the client takes it."""
+    if image_cache is None:
+        return redirect(IMAGE_URL_PREFIX + filename)
+    if width not in VARIANT_WIDTHS:
+        abort(404)
+
+    if 'image/webp' in request.headers.get('Accept', ''):
+        fmt = 'webp'
+    elif filename.lower().endswith('.png'):
+        fmt = 'png'  # Keep transparency
+    else:
+        fmt = 'jpeg'
+
+    try:
+        opened = image_cache.open(filename, width, fmt)
+    except OSError as e:  # Includes Pillow's UnidentifiedImageError
+        app.logger.warning("Image resize error for %s at %dpx: %s", filename, width, e)
+        abort(404)
+    if opened is None:
+        abort(404)
+
+    # Sent from the open file, so another worker evicting the variant meanwhile can't cut it short
+    name, variant = opened
+    response = send_file(variant, mimetype=f'image/{fmt}', max_age=IMAGE_MAX_AGE,
+                         etag=os.path.splitext(name)[0], conditional=True)
+    if response.status_code == 200:
+        # send_file can't size an open file; a 304 must not advertise the variant's length
+        response.content_length = os.fstat(variant.fileno()).st_size
+    response.vary.add('Accept')
+    return response
+
+
+# --- Catalog Helpers ---
+# The shop is paginated with keyset cursors on (sort key, id) instead of OFFSET,
+# so every page is a bounded index range scan no matter how deep the user pages.
+# See the idx_products_* indexes in migrations.py.
+
+PRODUCT_COLUMNS = '''
+    p.id, p.name, p.price, p.price_cents, p.currency, p.price_is_from, p.billing_period, p.image_url,
+    c.name as category_name, c.slug as category_slug, c.type as category_type
+'''
+
+# ?sort= value -> (sort column, row field holding the key, descending?)
+SORT_ORDERS = {
+    'name': ('p.name', 'name', False),
+    'price': ('p.price_cents', 'price_cents', False),
+    'price_desc': ('p.price_cents', 'price_cents', True),
+}
+
+def encode_cursor(key, prod_id):
+    """Encodes a (sort key, id) keyset position as an opaque URL-safe token."""
+    raw = json.dumps([key, prod_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodes a cursor made by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, prod_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(key, (str, int)) or isinstance(key, bool) or not isinstance(prod_id, int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return key, prod_id
+
+def resolve_filter(slug):
+    """
+    Turns a filter slug into a SQL condition on products/categories.
+    - 'all' (or empty) matches everything.
+    - A meta slug ('goods'/'services') matches every category of that type, plus
+      products filed directly under the meta category itself.
+    - Any other slug matches that single category.
+    Returns (sql, args), or None if the slug is unknown.
+    """
+    if not slug or slug == 'all':
+        return '', []
+    category = query_db('SELECT id, type FROM categories WHERE slug = ?', [slug], one=True)
+    if category is None:
+        return None
+    if category['type'] == 'meta':
+        return '(c.type = ? OR p.category_id = ?)', [slug, category['id']]
+    return 'p.category_id = ?', [category['id']]
+
+def fetch_product_page(filter_slug='all', sort='name', min_cents=None, max_cents=None,
+                       after=None, before=None, limit=PAGE_SIZE):
+    """
+    Fetches one page of products ordered by one of SORT_ORDERS, optionally
+    restricted to a price range (in cents, inclusive).
+    `after`/`before` are cursors from a previous page; pass at most one of them.
+    Returns a dict with 'products', 'next_cursor' and 'prev_cursor', or None if
+    the filter slug is unknown or the query failed.
+    """
+    resolved = resolve_filter(filter_slug)
+    if resolved is None:
+        return None
+    condition, args = resolved
+    conditions = [condition] if condition else []
+
+    column, key_field, descending = SORT_ORDERS[sort]
+    # In name order the price range is a filter on the (category_id,) name, id index
+    # walk, which stops once it has a page. Left usable, the price index wins the plan
+    # and every product in the range is sorted by name in a temp b-tree; unary +
+    # takes it out of the running.
+    price = 'p.price_cents' if column == 'p.price_cents' else '+p.price_cents'
+    if min_cents is not None:
+        conditions.append(f'{price} >= ?')
+        args = args + [min_cents]
+    if max_cents is not None:
+        conditions.append(f'{price} <= ?')
+        args = args + [max_cents]
+
+    backwards = before is not None
+    # Walking a descending order forwards is walking it ascending backwards
+    reverse_scan = descending != backwards
+    if after is not None or backwards:
+        conditions.append(f'({column}, p.id) {"<" if reverse_scan else ">"} (?, ?)')
+        args = args + list(before if backwards else after)
+
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    order = f'{column} DESC, p.id DESC' if reverse_scan else f'{column}, p.id'
+    # Fetch one extra row to learn whether another page exists in this direction
+    rows = query_db(f'''
+        SELECT {PRODUCT_COLUMNS}
+        FROM products p
+        JOIN categories c ON p.category_id = c.id
+        {where}
+        ORDER BY {order}
+        LIMIT ?
+    ''', args + [limit + 1])
+    if rows is None:
+        return None
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if backwards:
+            # We came from the page after this one, so it always exists
+            next_cursor = encode_cursor(last[key_field], last['id'])
+            if has_more:
+                prev_cursor = encode_cursor(first[key_field], first['id'])
+        else:
+            if has_more:
+                next_cursor = encode_cursor(last[key_field], last['id'])
+            if after is not None:
+                prev_cursor = encode_cursor(first[key_field], first['id'])
+
+    return {'products': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+def page_args_from_request(default_limit=PAGE_SIZE):
+    """
+    Reads the listing parameters (?category=, ?sort=, ?min_price=, ?max_price=,
+    ?after=, ?before=, ?limit=) from the current request as keyword arguments
+    for fetch_product_page. A price range without an explicit ?sort= is listed
+    in price order; ?sort=name is always honored. Aborts with 400 on bad input.
+    """
+    listing = {
+        'filter_slug': request.args.get('category', 'all'),
+        'sort': request.args.get('sort', 'name'),
+        'limit': request.args.get('limit', default_limit, type=int),
+    }
+    if listing['sort'] not in SORT_ORDERS:
+        abort(400, description=f"sort must be one of: {', '.join(SORT_ORDERS)}")
+    if listing['limit'] < 1 or listing['limit'] > MAX_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    try:
+        for bound in ('min_price', 'max_price'):
+            if request.args.get(bound):
+                listing[bound.replace('_price', '_cents')] = parse_amount(request.args[bound])
+        if 'sort' not in request.args and ('min_cents' in listing or 'max_cents' in listing):
+            # By default a price range is listed by price: that walks the (category_id,)
+            # price_cents, id index inside the range, where name order filters the name
+            # index row by row until it has a page of products in the range
+            listing['sort'] = 'price'
+        key_type = str if listing['sort'] == 'name' else int
+        for direction in ('after', 'before'):
+            if request.args.get(direction):
+                listing[direction] = decode_cursor(request.args[direction])
+                if not isinstance(listing[direction][0], key_type):
+                    raise ValueError(f"Cursor does not match sort order '{listing['sort']}'")
+    except ValueError as e:
+        abort(400, description=str(e))
+    if 'after' in listing and 'before' in listing:
+        abort(400, description="Pass either 'after' or 'before', not both")
+    return listing
+
+# Category facets with product counts, read from the materialized
+# category_counts/type_counts tables (see create_facet_counts in migrations.py):
+# one row per category, however many products there are.
+FACET_CATEGORIES_SQL = '''
+    SELECT c.id, c.name, c.slug, c.type, COALESCE(cc.product_count, 0) AS product_count
+    FROM categories c
+    LEFT JOIN category_counts cc ON cc.category_id = c.id
+    WHERE c.type != 'meta'
+    ORDER BY c.name
+'''
+# A meta facet counts what resolve_filter matches: every product of its type
+# plus any filed under the meta category itself ('all' counts everything).
+FACET_META_CATEGORIES_SQL = '''
+    SELECT c.id, c.name, c.slug, c.type,
+           CASE WHEN c.slug = 'all' THEN (SELECT COALESCE(SUM(product_count), 0) FROM type_counts)
+                ELSE COALESCE(cc.product_count, 0) + COALESCE(tc.product_count, 0)
+           END AS product_count
+    FROM categories c
+    LEFT JOIN category_counts cc ON cc.category_id = c.id
+    LEFT JOIN type_counts tc ON tc.type = c.slug
+    WHERE c.type = 'meta'
+    ORDER BY c.name
+'''
+
+def listing_query_args(keys=('category', 'sort', 'min_price', 'max_price')):
+    """The current request's non-empty listing args, for links that keep the view (cursors excluded)."""
+    return {key: request.args[key] for key in keys if request.args.get(key)}
+
+# --- Search ---
+# Backed by the products_fts FTS5 table, which triggers keep in sync with
+# products/categories (see create_search_index in migrations.py).
+
+def fts_match_query(text, columns=None):
+    """
+    Builds a safe FTS5 MATCH expression from free text: every word must match
+    as a prefix ("mac pro" -> "mac"* "pro"*), so partly typed words anywhere in
+    the query still match. User input is reduced to quoted words, so FTS5
+    query syntax in it has no effect.
+    `columns` restricts the match to those FTS columns.
+    Returns None if the text has no searchable words.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    expression = ' '.join(f'"{word}"*' for word in words)
+    if columns:
+        return f'{{{" ".join(columns)}}} : ({expression})'
+    return expression
+
+def search_products(text, limit=SEARCH_PAGE_SIZE, offset=0):
+    """Full-text search over product and category names, best matches first (bm25, names weighted 5x)."""
+    match = fts_match_query(text)
+    if match is None:
+        return []
+    return query_db(f'''
+        SELECT {PRODUCT_COLUMNS}
+        FROM products_fts
+        JOIN products p ON p.id = products_fts.rowid
+        JOIN categories c ON p.category_id = c.id
+        WHERE products_fts MATCH ?
+        ORDER BY bm25(products_fts, 10.0, 2.0), p.id
+        LIMIT ? OFFSET ?
+    ''', [match, limit, offset])
+
+def autocomplete_products(text, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Suggests product names for a partially typed query. Takes the first few
+    prefix-index hits without bm25 ranking (which would score every match)
+    and orders just those, so the cost stays flat as the catalog grows.
+    """
+    text = (text or '').strip()
+    match = fts_match_query(text, columns=['name'])
+    if match is None or len(text) < AUTOCOMPLETE_MIN_CHARS:
+        return []
+    rows = query_db('SELECT rowid AS id, name FROM products_fts WHERE products_fts MATCH ? LIMIT ?',
+                    [match, limit * 4])
+    if rows is None:
+        return None
+
+    lowered = text.lower()
+    suggestions, seen = [], set()
+    # Names that start with what was typed first, then shorter (more general) names
+    for row in sorted(rows, key=lambda r: (not r['name'].lower().startswith(lowered), len(r['name']), r['name'])):
+        if row['name'] not in seen:
+            seen.add(row['name'])
+            suggestions.append({'id': row['id'], 'name': row['name']})
+    return suggestions[:limit]
+
+# --- Response Caching ---
+# Read responses are memoized per (endpoint, query args) and replayed until
+# the catalog changes. Every product/category write, from whatever process,
+# advances the change feed's revision (see the Change Feed section), so each
+# lookup checks that one row and drops the cache once it has moved.
+# ETags are a hash of the body, so they agree across workers and restarts.
+
+def cached_catalog_response(render):
+    """
+    Serves the current request from catalog_cache, calling render() on a miss.
+    Answers 304 Not Modified when the client's If-None-Match still matches.
+    """
+    # Pages carrying one-off flash messages must be neither cached nor replayed
+    if '_flashes' in session:
+        return render()
+
+    key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+    version = latest_revision(get_read_db())
+    entry = catalog_cache.get(key, version)
+    if entry is None:
+        rv = make_response(render())
+        if rv.status_code != 200 or '_flashes' in session:
+            return rv
+        body = rv.get_data()
+        entry = CachedResponse(body, hashlib.sha256(body).hexdigest()[:32], rv.mimetype)
+        catalog_cache.put(key, version, entry)
+
+    response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    # Let browsers and nginx keep a copy but revalidate it on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
 # --- Routes ---
 
 @app.route('/')
@@ -51,56 +594,286 @@ def index():
 
 @app.route('/shop')
 def shop_page():
-    """Renders the main shop page, fetching data from DB."""
-    # Fetch products with their category info
-    products = query_db('''
-        SELECT p.id, p.name, p.price, p.image_url, c.name as category_name, c.slug as category_slug, c.type as category_type
-        FROM products p
-        JOIN categories c ON p.category_id = c.id
-        ORDER BY p.name
-    ''')
+    """Renders one page of the shop, filtered and paginated in SQL."""
+    return cached_catalog_response(render_shop_page)
+
+def render_shop_page():
+    listing = page_args_from_request()
+    search_query = request.args.get('q', '').strip()
+    if search_query:
+        # Search results are ranked, not paginated: show the best matches only
+        products = search_products(search_query)
+        page = None if products is None else {'products': products, 'next_cursor': None, 'prev_cursor': None}
+    else:
+        page = fetch_product_page(**listing)
 
     # Fetch categories for the filter list (exclude meta-categories for direct filtering)
-    categories = query_db("SELECT id, name, slug, type FROM categories WHERE type != 'meta' ORDER BY name")
+    categories = query_db(FACET_CATEGORIES_SQL)
 
     # Fetch meta categories separately if needed for the UI (like 'All', 'Goods', 'Services')
-    meta_categories = query_db("SELECT id, name, slug, type FROM categories WHERE type = 'meta' ORDER BY name")
+    meta_categories = query_db(FACET_META_CATEGORIES_SQL)
 
 
-    if products is None or categories is None or meta_categories is None:
+    if page is None or categories is None or meta_categories is None:
         # Handle database query errors (e.g., show an error page)
         # query_db already flashes an error for admin, but maybe show generic user error
          flash("Could not load shop data. Please try again later.", "error")
-         products = []
+         page = {'products': [], 'next_cursor': None, 'prev_cursor': None}
          categories = []
          meta_categories = []
 
 
     return render_template('shop.html',
-                           products=products,
+                           products=page['products'],
+                           next_cursor=page['next_cursor'],
+                           prev_cursor=page['prev_cursor'],
+                           current_filter=listing['filter_slug'],
+                           current_sort=listing['sort'],
+                           search_query=search_query,
+                           # Query args every shop link should carry over (cursors excluded)
+                           listing_args=listing_query_args(),
                            categories=categories,
                            meta_categories=meta_categories)
 
 
+@app.route('/api/products')
+def api_products():
+    """JSON variant of the shop listing: one keyset page of products."""
+    return cached_catalog_response(render_api_products)
+
+def render_api_products():
+    listing = page_args_from_request()
+    page = fetch_product_page(**listing)
+    if page is None:
+        abort(404, description=f"Unknown category '{listing['filter_slug']}'")
+
+    return jsonify({
+        'products': [dict(row) for row in page['products']],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    })
+
+
+@app.route('/api/search')
+def api_search():
+    """Ranked full-text search over products; ?q= is required, ?limit=/?offset= page through results."""
+    return cached_catalog_response(render_api_search)
+
+def render_api_search():
+    text = request.args.get('q', '').strip()
+    if not text:
+        abort(400, description="Missing search query 'q'")
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if offset < 0 or offset > MAX_SEARCH_OFFSET:
+        abort(400, description=f"offset must be between 0 and {MAX_SEARCH_OFFSET}")
+
+    products = search_products(text, limit=limit, offset=offset)
+    if products is None:
+        abort(500, description="Search failed")
+    return jsonify({'query': text, 'products': [dict(row) for row in products]})
+
+
+@app.route('/api/autocomplete')
+def api_autocomplete():
+    """Product name suggestions for a partially typed search (?q=)."""
+    return cached_catalog_response(render_api_autocomplete)
+
+def render_api_autocomplete():
+    suggestions = autocomplete_products(request.args.get('q', ''))
+    if suggestions is None:
+        abort(500, description="Autocomplete failed")
+    return jsonify({'suggestions': suggestions})
+
+
+# --- Change Feed ---
+# Every product/category write gets a new catalog revision (recorded by the
+# triggers in create_change_feed, migrations.py), so clients that keep a
+# copy of the catalog can fetch just what changed since the revision they
+# last saw instead of reloading every page. Deletes leave tombstones.
+
+CHANGE_STREAM_POLL_SECONDS = 1.0   # How often an SSE stream checks for new revisions
+CHANGE_STREAM_HEARTBEAT_SECONDS = 15  # Comment line sent when idle, so proxies keep the connection
+CHANGE_STREAM_MAX_SECONDS = 300    # Streams end after this; EventSource reconnects with Last-Event-ID
+MAX_CHANGE_STREAMS = 32            # Each open stream holds a server thread
+change_stream_slots = threading.BoundedSemaphore(MAX_CHANGE_STREAMS)
+
+def latest_revision(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'catalog_changes'").fetchone()
+    return row[0] if row else 0
+
+def fetch_changes(conn, since, limit=CHANGES_PAGE_SIZE):
+    """
+    The catalog changes after revision `since`, oldest first, each entity at
+    most once (its latest state). Upserts carry the current product/category
+    row, tombstones only the id. Reads in one transaction, so the rows match
+    the revisions returned. An upsert whose row can't be read is sent as a
+    tombstone rather than failing the whole page (and every poll after it).
+    Returns a dict with 'changes', 'revision' (pass it as `since` next time)
+    and 'has_more'.
+    """
+    def run(sql, args):
+        start = time.perf_counter()
+        rows = conn.execute(sql, args).fetchall()
+        record_query(sql, time.perf_counter() - start, args)
+        return rows
+
+    conn.execute('BEGIN')
+    try:
+        changes = run('''
+            SELECT revision, entity, entity_id, deleted FROM catalog_changes
+            WHERE revision > ? ORDER BY revision LIMIT ?
+        ''', [since, limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        upserted = {'product': [], 'category': []}
+        for change in changes:
+            if not change['deleted']:
+                upserted[change['entity']].append(change['entity_id'])
+        rows = {}
+        if upserted['product']:
+            # LEFT JOIN: a product whose category row is missing still gets its upsert
+            for row in run(f'''
+                SELECT {PRODUCT_COLUMNS}, p.category_id
+                FROM products p
+                LEFT JOIN categories c ON p.category_id = c.id
+                WHERE p.id IN ({SELECTED_IDS})
+            ''', [json.dumps(upserted['product'])]):
+                rows['product', row['id']] = dict(row)
+        if upserted['category']:
+            for row in run(f'SELECT id, name, slug, type FROM categories WHERE id IN ({SELECTED_IDS})',
+                           [json.dumps(upserted['category'])]):
+                rows['category', row['id']] = dict(row)
+    finally:
+        conn.commit()
+
+    feed = []
+    for change in changes:
+        row = None if change['deleted'] else rows.get((change['entity'], change['entity_id']))
+        entry = {'revision': change['revision'], 'type': change['entity'], 'id': change['entity_id'],
+                 'deleted': row is None}
+        if row is not None:
+            entry[change['entity']] = row
+        feed.append(entry)
+    return {'changes': feed, 'revision': changes[-1]['revision'] if changes else since, 'has_more': has_more}
+
+def since_from_request():
+    """?since= (or the Last-Event-ID header of a reconnecting EventSource). Aborts with 400/410 if unusable."""
+    try:
+        since = int(request.args.get('since', request.headers.get('Last-Event-ID', '0')))
+    except ValueError:
+        since = -1
+    if since < 0:
+        abort(400, description="since must be a revision number (0 for the whole catalog)")
+    if since > latest_revision(get_read_db()):
+        # The database was recreated (init_db.py): the client's copy is from another catalog
+        abort(410, description="Unknown revision; fetch the catalog again from since=0")
+    return since
+
+@app.route('/api/changes')
+def api_changes():
+    """
+    Catalog changes after ?since=<revision>, ?limit= per response. since=0
+    pages through the whole catalog, so a new client can build its copy
+    from this endpoint alone.
+    """
+    since = since_from_request()
+    limit = request.args.get('limit', CHANGES_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_CHANGES_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {MAX_CHANGES_PAGE_SIZE}")
+    page = fetch_changes(get_read_db(), since, limit)
+    response = jsonify(page)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/changes/stream')
+def api_changes_stream():
+    """
+    Server-Sent Events version of /api/changes: one 'change' event per
+    change, with the revision as the event id. Polls the feed (one indexed
+    range query) every CHANGE_STREAM_POLL_SECONDS.
+    """
+    since = since_from_request()
+    if not change_stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open change streams, retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(CHANGE_STREAM_POLL_SECONDS * 5))
+        return response
+
+    def generate(since):
+        yield f'retry: {int(CHANGE_STREAM_POLL_SECONDS * 2000)}\n\n'
+        started = last_sent = time.monotonic()
+        while time.monotonic() - started < CHANGE_STREAM_MAX_SECONDS:
+            # The response outlives the request context, so check out a connection per poll
+            conn = read_pool.acquire()
+            try:
+                page = fetch_changes(conn, since)
+            finally:
+                read_pool.release(conn)
+            for change in page['changes']:
+                yield f"id: {change['revision']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+            since = page['revision']
+            now = time.monotonic()
+            if page['changes']:
+                last_sent = now
+            elif now - last_sent >= CHANGE_STREAM_HEARTBEAT_SECONDS:
+                yield ': keepalive\n\n'
+                last_sent = now
+            if not page['has_more']:
+                time.sleep(CHANGE_STREAM_POLL_SECONDS)
+
+    response = Response(generate(since), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the client left before the first event
+    response.call_on_close(change_stream_slots.release)
+    return response
+
+
 # --- Admin Routes (Simple CRUD) ---
 
 @app.route('/admin')
 def admin_page():
-    """Shows the admin dashboard to manage categories and products."""
-    categories = query_db("SELECT id, name, slug, type FROM categories ORDER BY type, name")
-    products = query_db('''
-        SELECT p.id, p.name, p.price, p.image_url, c.name as category_name
-        FROM products p
-        JOIN categories c ON p.category_id = c.id
-        ORDER BY c.name, p.name
+    """
+    Shows the admin dashboard: every category, and one page of products that
+    can be filtered, sorted and searched (?q=) like the shop listing.
+    """
+    listing = page_args_from_request(default_limit=ADMIN_PAGE_SIZE)
+    search_query = request.args.get('q', '').strip()
+    categories = query_db('''
+        SELECT c.id, c.name, c.slug, c.type, COALESCE(cc.product_count, 0) AS product_count
+        FROM categories c
+        LEFT JOIN category_counts cc ON cc.category_id = c.id
+        ORDER BY c.type, c.name
     ''')
 
+    page = {'products': [], 'next_cursor': None, 'prev_cursor': None, 'next_offset': None, 'prev_offset': None}
+    if search_query:
+        # Ranked search results page by offset (bounded by MAX_SEARCH_OFFSET)
+        offset = min(max(request.args.get('offset', 0, type=int), 0), MAX_SEARCH_OFFSET)
+        products = search_products(search_query, limit=listing['limit'] + 1, offset=offset)
+        if products is not None:
+            page['products'] = products[:listing['limit']]
+            if len(products) > listing['limit'] and offset + listing['limit'] <= MAX_SEARCH_OFFSET:
+                page['next_offset'] = offset + listing['limit']
+            if offset > 0:
+                page['prev_offset'] = max(offset - listing['limit'], 0)
+    else:
+        products = fetch_product_page(**listing)
+        if products is not None:
+            page.update(products)
+
     if categories is None or products is None:
          flash("Could not load admin data.", "error")
-         categories = []
-         products = []
+         categories = categories or []
 
-    return render_template('admin.html', categories=categories, products=products)
+    return render_template('admin.html', categories=categories, page=page,
+                           current_filter=listing['filter_slug'], current_sort=listing['sort'],
+                           search_query=search_query,
+                           listing_args=listing_query_args(('category', 'sort', 'min_price', 'max_price', 'q')),
+                           return_to=request.full_path)
 
 # -- Categories CRUD --
 
@@ -176,11 +949,25 @@ def add_product():
          # You might want more robust validation or a file upload mechanism here
          return redirect(url_for('admin_page'))
 
+    # Store the price in structured form; the display string is rebuilt from it
+    try:
+        parsed = parse_price(price)
+    except ValueError:
+        flash("Price must look like '$999', 'From $99' or '$10.99/month'.", "error")
+        return redirect(url_for('admin_page'))
+
+    # Foreign keys aren't enforced on our connections: an unknown id would leave the
+    # product out of every listing and facet count
+    if query_db('SELECT 1 FROM categories WHERE id = ?', [category_id], one=True) is None:
+        flash(f"Category with ID {category_id} not found.", "error")
+        return redirect(url_for('admin_page'))
 
     try:
         db = get_db()
-        db.execute('INSERT INTO products (name, price, image_url, category_id) VALUES (?, ?, ?, ?)',
-                   (name, price, image_url, category_id))
+        db.execute('''
+            INSERT INTO products (name, price, price_cents, currency, price_is_from, billing_period, image_url, category_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (name, format_price(*parsed), *parsed, image_url, category_id))
         db.commit()
         flash(f"Product '{name}' added successfully.", "success")
     except sqlite3.Error as e:
@@ -210,6 +997,207 @@ def delete_product(prod_id):
     return redirect(url_for('admin_page'))
 
 
+# -- Bulk Edits --
+# Each bulk action is one UPDATE/DELETE over the selected ids in a single
+# transaction, instead of a lookup + write + commit per product. The ids go
+# in as one JSON array (json_each), so selections aren't limited by SQLite's
+# bound-parameter cap.
+
+BULK_ACTIONS = ('delete', 'reprice', 'recategorize')
+MAX_REPRICE_PERCENT = 1000  # A bulk percentage change can at most multiply prices by 11
+SELECTED_IDS = 'SELECT value FROM json_each(?)'
+
+def admin_return_url():
+    """Where to go after an admin form post: back to the listing page it came from."""
+    return_to = request.form.get('return_to', '')
+    if return_to.startswith('/admin') and '//' not in return_to:
+        return return_to
+    return url_for('admin_page')
+
+@app.route('/admin/products/bulk', methods=['POST'])
+def bulk_update_products():
+    action = request.form.get('action')
+    product_ids = sorted(set(request.form.getlist('product_ids', type=int)))
+    if action not in BULK_ACTIONS:
+        flash("Choose a bulk action.", "error")
+        return redirect(admin_return_url())
+    if not product_ids:
+        flash("Select at least one product.", "error")
+        return redirect(admin_return_url())
+    ids_json = json.dumps(product_ids)
+
+    # Validate everything before opening the transaction
+    if action == 'recategorize':
+        category_id = request.form.get('category_id', type=int)
+        category = query_db('SELECT name, type FROM categories WHERE id = ?', [category_id], one=True)
+        if category is None or category['type'] == 'meta':
+            flash("Choose a (non-meta) category to move the products to.", "error")
+            return redirect(admin_return_url())
+    elif action == 'reprice':
+        new_price = request.form.get('price', '').strip()
+        percent = request.form.get('percent', '').strip()
+        try:
+            parsed = parse_price(new_price) if new_price else None
+            factor = 1 + float(percent) / 100 if (percent and not new_price) else None
+        except ValueError:
+            flash("Enter a price like '$999' / 'From $10.99/month', or a percentage like -10.", "error")
+            return redirect(admin_return_url())
+        # float() accepts 'nan', 'inf' and '1e308', which would fail (or overflow) mid-update
+        if parsed is None and (factor is None or not math.isfinite(factor)
+                               or not 0 <= factor <= 1 + MAX_REPRICE_PERCENT / 100):
+            flash(f"Enter a new price or a percentage change from -100 to {MAX_REPRICE_PERCENT}.", "error")
+            return redirect(admin_return_url())
+
+    db = get_db()
+    try:
+        with db:  # Commits once on success, rolls everything back on error
+            if action == 'delete':
+                affected = db.execute(f'DELETE FROM products WHERE id IN ({SELECTED_IDS})', [ids_json]).rowcount
+                message = f"Deleted {affected} products."
+            elif action == 'recategorize':
+                affected = db.execute(f'UPDATE products SET category_id = ? WHERE id IN ({SELECTED_IDS})',
+                                      [category_id, ids_json]).rowcount
+                message = f"Moved {affected} products to '{category['name']}'."
+            elif parsed is not None:
+                affected = db.execute(f'''
+                    UPDATE products
+                    SET price = ?, price_cents = ?, currency = ?, price_is_from = ?, billing_period = ?
+                    WHERE id IN ({SELECTED_IDS})
+                ''', [format_price(*parsed), *parsed, ids_json]).rowcount
+                message = f"Set the price of {affected} products to {format_price(*parsed)}."
+            else:
+                # Scale each price, then rebuild its display string from the new amount
+                rows = db.execute(f'''
+                    SELECT id, price_cents, currency, price_is_from, billing_period
+                    FROM products WHERE id IN ({SELECTED_IDS})
+                ''', [ids_json]).fetchall()
+                updates = []
+                for row in rows:
+                    cents = max(0, round(row['price_cents'] * factor))
+                    display = format_price(cents, row['currency'], bool(row['price_is_from']), row['billing_period'])
+                    updates.append((display, cents, row['id']))
+                db.executemany('UPDATE products SET price = ?, price_cents = ? WHERE id = ?', updates)
+                affected = len(updates)
+                message = f"Repriced {affected} products by {percent}%."
+    except sqlite3.Error as e:
+        flash(f"Database error during bulk {action}: {e}", "error")
+        return redirect(admin_return_url())
+
+    flash(message, "success" if affected else "warning")
+    return redirect(admin_return_url())
+
+
+# -- Bulk Import / Export --
+
+IMPORT_ERRORS_SHOWN = 10  # Row errors listed in the flash message after an upload
+
+@app.route('/admin/products/import', methods=['POST'])
+def import_products_upload():
+    """Loads products from an uploaded CSV/JSONL file (see catalog_io.py for the format)."""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        flash("Choose a CSV or JSONL file to import.", "error")
+        return redirect(url_for('admin_page'))
+
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    if fmt not in FORMATS:
+        flash(f"Unsupported import format '{fmt}'.", "error")
+        return redirect(url_for('admin_page'))
+
+    # Werkzeug spools large uploads to disk, so this reads the file row by row
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    report = ImportReport()
+    stopped = False
+    try:
+        import_products(get_db(), stream, fmt, report=report)
+    except (sqlite3.Error, UnicodeDecodeError, csv.Error) as e:
+        # Batches committed before the error stay imported, so still report them below
+        flash(f"Import stopped part way: {e}", "error")
+        stopped = True
+
+    flash(f"Imported {report.inserted} products, rejected {report.failed} rows.",
+          "success" if not (report.failed or stopped) else "warning")
+    for error in report.errors[:IMPORT_ERRORS_SHOWN]:
+        flash(f"Line {error.line}: {error.message}", "error")
+    if report.failed > IMPORT_ERRORS_SHOWN:
+        flash(f"... and {report.failed - IMPORT_ERRORS_SHOWN} more rejected rows.", "error")
+    return redirect(url_for('admin_page'))
+
+@app.route('/admin/products/export')
+def export_products_download():
+    """Streams the whole catalog as CSV (default) or JSONL (?format=jsonl)."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, description=f"format must be one of: {', '.join(FORMATS)}")
+
+    def generate():
+        # The response outlives the request context, so use a connection of our own
+        conn = read_pool.acquire()
+        try:
+            yield from export_products(conn, fmt)
+        finally:
+            read_pool.release(conn)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=products.{fmt}'})
+
+
+# --- Metrics Endpoint ---
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (request and query latency histograms)."""
+    return Response(metrics_registry.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# --- Profiling Endpoint ---
+
+PROFILE_FORMATS = ('json', 'collapsed', 'pstats')
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """
+    Controls this worker's profiler (send the X-Profile-Token header).
+    - POST starts a profile: ?rate= share of requests (default 1), ?seconds=
+      window (default 30), ?route= (repeatable) to profile only those routes.
+    - DELETE stops it (writing it to SHOP_PROFILE_DIR).
+    - GET returns the status, or with ?format=collapsed|pstats the samples
+      so far (of one ?route=, or all).
+    """
+    if not PROFILE_TOKEN:
+        abort(404)
+    token = request.headers.get('X-Profile-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), PROFILE_TOKEN.encode('utf-8')):
+        abort(403)
+
+    if request.method == 'POST':
+        rate = request.args.get('rate', 1.0, type=float)
+        seconds = request.args.get('seconds', 30.0, type=float)
+        if not 0 < rate <= 1 or seconds <= 0:
+            abort(400, description="rate must be in (0, 1] and seconds positive")
+        if not profiler.start(sample_rate=rate, seconds=seconds, routes=request.args.getlist('route')):
+            abort(409, description="A profile is already running; DELETE it first")
+        return jsonify(profiler.status())
+    if request.method == 'DELETE':
+        files = profiler.stop()
+        return jsonify(dict(profiler.status(), files=files))
+
+    fmt = request.args.get('format', 'json')
+    if fmt not in PROFILE_FORMATS:
+        abort(400, description=f"format must be one of: {', '.join(PROFILE_FORMATS)}")
+    route = request.args.get('route')
+    if fmt == 'collapsed':
+        return Response(profiler.collapsed(route), mimetype='text/plain')
+    if fmt == 'pstats':
+        # pstats can only write to a file; load the download with pstats.Stats(path)
+        stats = profiler.pstats(route)
+        buffer = io.BytesIO(marshal.dumps(stats.stats))
+        return send_file(buffer, mimetype='application/octet-stream', as_attachment=True,
+                         download_name='profile.pstats')
+    return jsonify(profiler.status())
+
+
 # --- Run the App ---
 if __name__ == '__main__':
     # Use debug=True only for development!
@@ -0,0 +1,115 @@
+# build_assets.py
+"""
+Builds the fingerprinted, precompressed copies of jobs/static/css and
+jobs/static/js that the app serves with year-long cache headers.
+
+For each source file this writes, under static/dist/:
+    css/shop.<hash>.css      content-hashed copy
+    css/shop.<hash>.css.gz   gzip variant served to clients that accept it
+plus manifest.json mapping 'css/shop.css' -> 'dist/css/shop.<hash>.css',
+which the asset_url() template helper in app.py reads.
+
+Files are copied byte for byte: gzip gets most of what a minifier would
+save, and regex minification breaks selectors like `a :hover`, strings and
+template literals. Hashed files of the last KEEP_BUILDS builds are kept
+(listed in builds.json), since pages rendered or cached before a deploy,
+and workers not yet restarted, still point at them; older ones are pruned.
+
+Run from the jobs/ directory before starting (or restarting) the app:
+    python build_assets.py [--keep-builds 5]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+BUILDS_PATH = os.path.join(DIST_DIR, 'builds.json')  # Manifests of the builds whose files are kept
+SOURCE_DIRS = ('css', 'js')
+ASSET_EXTENSIONS = ('.css', '.js')
+HASH_LENGTH = 12
+KEEP_BUILDS = 5
+
+
+def write_json(path, data):
+    """Writes `data` to `path` atomically, so a worker reloading it never sees half a file."""
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def build_asset(relative_path):
+    """Fingerprints and gzips one source file. Returns its dist path relative to static/."""
+    root, ext = os.path.splitext(relative_path)
+    with open(os.path.join(STATIC_DIR, relative_path), 'rb') as f:
+        content = f.read()
+
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    hashed_path = f'dist/{root}.{digest}{ext}'
+    target = os.path.join(STATIC_DIR, hashed_path)
+    if os.path.isfile(target) and os.path.isfile(target + '.gz'):
+        return hashed_path  # Same hash, same bytes; rewriting could truncate a file being served
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    for path, data in ((target, content), (target + '.gz', gzip.compress(content, compresslevel=9, mtime=0))):
+        # mtime=0 keeps the .gz byte-identical across builds of the same content
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    return hashed_path
+
+
+def prune(builds):
+    """Removes hashed files under static/dist that none of `builds` (manifests) refers to. Returns their paths."""
+    kept = set()
+    for manifest in builds:
+        for hashed_path in manifest.values():
+            kept.update((hashed_path, hashed_path + '.gz'))
+    removed = []
+    for dirpath, _, filenames in os.walk(DIST_DIR):
+        for filename in filenames:
+            if not filename.removesuffix('.gz').endswith(ASSET_EXTENSIONS):
+                continue  # manifest.json, builds.json
+            relative_path = os.path.relpath(os.path.join(dirpath, filename), STATIC_DIR).replace(os.sep, '/')
+            if relative_path not in kept:
+                os.remove(os.path.join(dirpath, filename))
+                removed.append(relative_path)
+    return removed
+
+
+def build_all(keep_builds=KEEP_BUILDS):
+    """Builds every asset, writes the manifest and prunes files no longer referenced by the last `keep_builds` builds."""
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        for dirpath, _, filenames in os.walk(os.path.join(STATIC_DIR, source_dir)):
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1] not in ASSET_EXTENSIONS:
+                    continue
+                relative_path = os.path.relpath(os.path.join(dirpath, filename), STATIC_DIR).replace(os.sep, '/')
+                manifest[relative_path] = build_asset(relative_path)
+                print(f"{relative_path} -> {manifest[relative_path]}")
+
+    builds = []
+    if os.path.exists(BUILDS_PATH):
+        with open(BUILDS_PATH, encoding='utf-8') as f:
+            builds = json.load(f)
+    if not builds or builds[-1] != manifest:
+        builds.append(manifest)
+    builds = builds[-max(1, keep_builds):]
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    write_json(BUILDS_PATH, builds)
+    write_json(MANIFEST_PATH, manifest)
+    removed = prune(builds)
+    print(f"Wrote {len(manifest)} assets to {MANIFEST_PATH}; pruned {len(removed)} files of older builds")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fingerprint and gzip the static CSS/JS assets.")
+    parser.add_argument('--keep-builds', type=int, default=KEEP_BUILDS,
+                        help=f"Keep the hashed files of this many most recent builds (default {KEEP_BUILDS})")
+    build_all(parser.parse_args().keep_builds)
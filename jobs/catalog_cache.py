@@ -0,0 +1,61 @@
+# catalog_cache.py
+import threading
+from collections import OrderedDict, namedtuple
+
+# A rendered response ready to be replayed: body bytes, strong ETag and mimetype
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'mimetype'])
+
+
+class CatalogCache:
+    """
+    In-process cache of rendered catalog responses.
+
+    Entries are keyed by whatever identifies a request (endpoint + query args)
+    and are only valid for the catalog version they were rendered at. The
+    version comes from the database (the app passes the change feed's latest
+    revision), so writes from any process - other workers, the CLI importer,
+    migrations, manual SQL - invalidate the cache: the first lookup that
+    sees a new version drops every entry.
+    The cache holds at most `max_entries` responses, evicting the least
+    recently used one first, since cursors make the key space unbounded.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key, version):
+        """Returns the CachedResponse for `key` rendered at catalog `version`, or None."""
+        with self._lock:
+            if version != self._version:
+                # Any change, not just a newer one: a recreated database starts over at 0
+                self._version = version
+                self._entries.clear()
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, entry):
+        """
+        Stores `entry` for `key` if it was rendered at the current version.
+        A render that raced with a newer version is simply not stored.
+        """
+        with self._lock:
+            if version != self._version:
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,254 @@
+# catalog_io.py
+"""
+Streaming bulk import/export of products as CSV or JSON Lines.
+
+Both directions work row by row, so memory use stays flat whatever the file
+size. Imports resolve category slugs with a single query up front, insert in
+large batched transactions and collect per-row errors instead of aborting.
+
+Command line (run from the jobs/ directory):
+    python catalog_io.py import products.csv [--batch-size 5000]
+    python catalog_io.py export products.jsonl     # or '-' for stdout
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import sqlite3
+import sys
+from collections import namedtuple
+
+from db_pool import DEFAULT_PRAGMAS
+from pricing import parse_price, format_price
+
+DATABASE = 'database.db'
+
+FORMATS = ('csv', 'jsonl')
+# Columns in exported files, and the ones an imported row must provide
+FIELDS = ['name', 'price', 'image_url', 'category_slug']
+
+DEFAULT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000   # Keep the report bounded on a badly broken file
+EXPORT_BATCH_SIZE = 1000
+
+INSERT_PRODUCT_SQL = '''
+    INSERT INTO products (name, price, price_cents, currency, price_is_from, billing_period, image_url, category_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# line: 1-based line (CSV: counting the header) or record number of the bad row
+RowError = namedtuple('RowError', ['line', 'message'])
+
+
+class ImportReport:
+    """Outcome of an import: rows inserted, rows rejected and (up to a cap) why."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, message))
+
+    def __repr__(self):
+        return f"<ImportReport inserted={self.inserted} failed={self.failed}>"
+
+
+def detect_format(filename, default='csv'):
+    """Guesses the file format from its extension."""
+    lowered = (filename or '').lower()
+    if lowered.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if lowered.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, fmt):
+    """Yields (line, row dict) pairs from a text stream; malformed records yield (line, None)."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, None
+                continue
+            yield line_no, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unsupported format: {fmt!r} (expected one of {', '.join(FORMATS)})")
+
+
+def prepare_row(row, category_map):
+    """Validates one input row and turns it into INSERT parameters. Raises ValueError with a readable reason."""
+    if row is None:
+        raise ValueError("Malformed record")
+    values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+    missing = [field for field in FIELDS if not values[field]]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+    if not values['image_url'].startswith('/static/images/'):
+        raise ValueError("Image URL must start with /static/images/")
+    category_id = category_map.get(values['category_slug'])
+    if category_id is None:
+        raise ValueError(f"Unknown category slug '{values['category_slug']}'")
+    parsed = parse_price(values['price'])
+    return (values['name'], format_price(*parsed), *parsed, values['image_url'], category_id)
+
+
+def _insert_batch(conn, batch, report):
+    """Inserts one batch in a single transaction; on failure retries row by row to pin down the bad rows."""
+    try:
+        conn.executemany(INSERT_PRODUCT_SQL, [params for _, params in batch])
+        conn.commit()
+        report.inserted += len(batch)
+        return
+    except sqlite3.Error:
+        conn.rollback()
+
+    inserted = 0
+    for line, params in batch:
+        try:
+            conn.execute(INSERT_PRODUCT_SQL, params)
+            inserted += 1
+        except sqlite3.Error as e:
+            report.add_error(line, f"Database error: {e}")
+    conn.commit()
+    # Counted only once committed, so a failed commit doesn't inflate the report
+    report.inserted += inserted
+
+
+def import_products(conn, stream, fmt, batch_size=DEFAULT_BATCH_SIZE, report=None):
+    """
+    Imports products from a CSV/JSONL text stream into the open connection.
+    Bad rows are skipped and reported; good rows are committed in batches of
+    `batch_size`, so an interrupted import keeps everything before the last batch.
+    Returns an ImportReport: `report` if one is passed in, which lets a caller
+    still see what was committed when the import raises part way (unreadable
+    file, database error).
+    """
+    category_map = dict(conn.execute('SELECT slug, id FROM categories').fetchall())
+    report = ImportReport() if report is None else report
+    batch = []
+    for line, row in read_rows(stream, fmt):
+        try:
+            batch.append((line, prepare_row(row, category_map)))
+        except ValueError as e:
+            report.add_error(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _insert_batch(conn, batch, report)
+            batch = []
+    if batch:
+        _insert_batch(conn, batch, report)
+    return report
+
+
+def iter_products(conn, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields every product as a dict of FIELDS, in id order. Reads in keyset
+    batches rather than through one long cursor, so an export of a large
+    table never pins a single read snapshot (and the WAL) for its whole run.
+    """
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT p.id, p.name, p.price, p.image_url, c.slug
+            FROM products p
+            JOIN categories c ON p.category_id = c.id
+            WHERE p.id > ?
+            ORDER BY p.id
+            LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        for prod_id, name, price, image_url, slug in rows:
+            yield {'name': name, 'price': price, 'image_url': image_url, 'category_slug': slug}
+        last_id = rows[-1][0]
+
+
+def export_products(conn, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Yields the catalog as chunks of CSV or JSONL text, one chunk per batch of rows."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt!r} (expected one of {', '.join(FORMATS)})")
+    buffer = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+
+    for count, product in enumerate(iter_products(conn, batch_size), start=1):
+        if writer is not None:
+            writer.writerow(product)
+        else:
+            buffer.write(json.dumps(product, ensure_ascii=False) + '\n')
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# --- Command Line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export of shop products (CSV or JSONL).")
+    parser.add_argument('--database', default=DATABASE, help=f"SQLite database file (default: {DATABASE})")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    import_cmd = subcommands.add_parser('import', help="Load products from a file ('-' for stdin)")
+    import_cmd.add_argument('path')
+    import_cmd.add_argument('--format', choices=FORMATS, help="Defaults to the file extension, else csv")
+    import_cmd.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    export_cmd = subcommands.add_parser('export', help="Write all products to a file ('-' for stdout)")
+    export_cmd.add_argument('path')
+    export_cmd.add_argument('--format', choices=FORMATS, help="Defaults to the file extension, else csv")
+
+    args = parser.parse_args(argv)
+    fmt = args.format or detect_format(args.path)
+    conn = sqlite3.connect(args.database)
+    # Same tuning as the app's pooled connections (WAL-safe synchronous=NORMAL, big cache)
+    for name, value in DEFAULT_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    try:
+        if args.command == 'import':
+            stream = contextlib.nullcontext(sys.stdin) if args.path == '-' else open(args.path, newline='', encoding='utf-8-sig')
+            report = ImportReport()
+            aborted = None
+            try:
+                with stream as source:
+                    import_products(conn, source, fmt, batch_size=args.batch_size, report=report)
+            except (sqlite3.Error, UnicodeDecodeError, csv.Error) as e:
+                aborted = e
+            for error in report.errors:
+                print(f"Line {error.line}: {error.message}", file=sys.stderr)
+            if report.failed > len(report.errors):
+                print(f"... and {report.failed - len(report.errors)} more errors", file=sys.stderr)
+            if aborted is not None:
+                print(f"Import stopped: {aborted}", file=sys.stderr)
+            # A running app picks the new rows up by itself: they advance the change feed's revision
+            print(f"{report.inserted} products imported, {report.failed} rows rejected.")
+            return 1 if report.failed or aborted is not None else 0
+        else:
+            stream = contextlib.nullcontext(sys.stdout) if args.path == '-' else open(args.path, 'w', newline='', encoding='utf-8')
+            with stream as target:
+                for chunk in export_products(conn, fmt):
+                    target.write(chunk)
+            return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
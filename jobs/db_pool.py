@@ -0,0 +1,82 @@
+# db_pool.py
+import sqlite3
+import threading
+from collections import deque
+
+# Applied to every pooled connection. WAL lets readers keep reading while an
+# admin write commits; synchronous=NORMAL is durable enough in WAL mode and
+# skips an fsync per commit.
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,       # ~64 MB page cache per connection (negative = KiB)
+    'mmap_size': 268435456,     # Map up to 256 MB of the file instead of read() calls
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,       # Wait up to 5 s for a lock instead of failing at once
+}
+
+# Prepared statements kept per connection. Pooled connections live for the
+# whole process, so the shop's handful of queries stay compiled.
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionPool:
+    """
+    A small pool of long-lived SQLite connections to one database file.
+
+    Connections are checked out for the length of a request and returned
+    afterwards rather than closed, so their page cache, mmap and statement
+    cache stay warm. Idle connections are reused most-recently-released
+    first; at most `max_idle` are kept around.
+
+    A read-only pool opens the file with mode=ro, so those connections can
+    never take the write lock and never contend with admin writes.
+    """
+
+    def __init__(self, database, readonly=False, max_idle=8, pragmas=None, factory=sqlite3.Connection):
+        self.database = database
+        self.readonly = readonly
+        self.factory = factory
+        self.max_idle = max_idle
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(f'file:{self.database}?mode=ro', uri=True,
+                                   check_same_thread=False, factory=self.factory,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.database, check_same_thread=False, factory=self.factory,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            # Persistent in the file, but cheap to re-assert for databases created elsewhere
+            conn.execute('PRAGMA journal_mode=WAL')
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        # Return rows as dictionary-like objects
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self):
+        """Returns an idle connection, opening a new one if none is available."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        """Gives a connection back to the pool, rolling back anything left uncommitted."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Closes every idle connection (e.g. before the database file is replaced)."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
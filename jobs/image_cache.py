@@ -0,0 +1,178 @@
+# image_cache.py
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it the shop serves original images
+    Image = ImageOps = None
+
+# Widths (px) we are willing to produce. A fixed set keeps the cache bounded
+# and stops arbitrary ?w= values from being used to fill the disk.
+VARIANT_WIDTHS = (160, 320, 640, 960)
+
+# Seconds between mtime refreshes of a variant that keeps being served; its
+# mtime is its position in the LRU order shared by all workers
+TOUCH_INTERVAL = 60
+
+# Output formats: file extension, Pillow format name, encoder options
+VARIANT_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('png', 'PNG', {'optimize': True}),
+}
+
+
+def resizing_available():
+    return Image is not None
+
+
+class ImageVariantCache:
+    """
+    Resized, re-encoded product images stored on disk and bounded in size.
+
+    A variant is identified by (source file, its mtime, width, format), so
+    replacing an original automatically produces fresh variants. All LRU
+    state lives in the directory itself, so every worker sharing it sees the
+    same cache: a hit refreshes the file's mtime (at most every
+    TOUCH_INTERVAL seconds), and after each render the directory is scanned
+    and the files with the oldest mtimes are deleted until the total is
+    within `max_bytes`. Variants are handed out as open files, so one that
+    is evicted while it is being sent is still served in full.
+
+    Each variant key has its own lock, so a burst of requests for the same
+    new variant renders it once (per worker) while the others wait.
+    """
+
+    def __init__(self, source_dir, cache_dir, max_bytes):
+        self.source_dir = os.path.abspath(source_dir)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}          # variant path -> [lock, number of waiters]
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def source_path(self, filename):
+        """Absolute path of an original image, or None if it is outside source_dir or missing."""
+        path = os.path.abspath(os.path.join(self.source_dir, filename))
+        if os.path.commonpath([path, self.source_dir]) != self.source_dir or not os.path.isfile(path):
+            return None
+        return path
+
+    def variant_name(self, source, width, fmt):
+        stat = os.stat(source)
+        key = f'{source}|{stat.st_mtime_ns}|{stat.st_size}|{width}|{fmt}'
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.' + VARIANT_FORMATS[fmt][0]
+
+    def open(self, filename, width, fmt):
+        """
+        Returns (variant name, file) for `filename` resized to `width` and
+        encoded as `fmt`, the file open for binary reading (the caller closes
+        it), rendering the variant first if needed. The name is unique to the
+        original's content and the variant settings. Returns None if the
+        original doesn't exist.
+        """
+        source = self.source_path(filename)
+        if source is None:
+            return None
+        name = self.variant_name(source, width, fmt)
+        path = os.path.join(self.cache_dir, name)
+
+        variant = self._open_cached(path)
+        if variant is not None:
+            return name, variant
+
+        key_lock = self._acquire_key_lock(path)
+        try:
+            # Someone else may have rendered it while we waited for the lock
+            variant = self._open_cached(path)
+            if variant is None:
+                variant = self._render(source, path, width, fmt)
+        finally:
+            self._release_key_lock(path, key_lock)
+        self._evict(keep=path)
+        return name, variant
+
+    def _open_cached(self, path):
+        """Opens a cached variant and marks it as recently used; None if it isn't (or no longer) cached."""
+        try:
+            variant = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        if time.time() - os.fstat(variant.fileno()).st_mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass  # Evicted meanwhile; the open file still reads fine
+        return variant
+
+    def _render(self, source, path, width, fmt):
+        """Resizes `source` into `path` (written atomically). Returns the new file, open and rewound."""
+        extension, pil_format, options = VARIANT_FORMATS[fmt]
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:  # Never upscale
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-', suffix='.' + extension)
+            variant = os.fdopen(fd, 'w+b')
+            try:
+                image.save(variant, pil_format, **options)
+                variant.flush()
+                os.replace(tmp_path, path)
+            except BaseException:
+                variant.close()
+                os.unlink(tmp_path)
+                raise
+        variant.seek(0)
+        return variant
+
+    # --- Eviction ---
+
+    def usage(self):
+        """(mtime, size, path) of every cached variant, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith('.'):
+                continue  # Renders in progress
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def _evict(self, keep=None):
+        """Deletes the least recently used variants (never `keep`) until the directory fits in max_bytes."""
+        entries = self.usage()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another worker evicted it first
+            total -= size
+
+    def _acquire_key_lock(self, name):
+        with self._lock:
+            entry = self._key_locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        return entry
+
+    def _release_key_lock(self, name, entry):
+        entry[0].release()
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._key_locks[name]
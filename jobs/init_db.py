@@ -2,6 +2,9 @@
 import sqlite3
 import os
 
+from migrations import migrate
+from pricing import parse_price, format_price
+
 DATABASE = 'database.db'
 
 # Define categories (name, slug, type ['goods' or 'services'])
@@ -50,34 +53,16 @@ def init_db():
     if os.path.exists(DATABASE):
         print(f"Removing existing database: {DATABASE}")
         os.remove(DATABASE)
+    # A leftover WAL from the old file must not be replayed into the new one
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(DATABASE + suffix):
+            os.remove(DATABASE + suffix)
 
+    # The schema is whatever the migrations build; seed data goes in afterwards
+    print("Creating tables...")
+    migrate(DATABASE)
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
-    print("Creating tables...")
-
-    # --- Create Categories Table ---
-    cursor.execute('''
-        CREATE TABLE categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            slug TEXT NOT NULL UNIQUE,
-            type TEXT NOT NULL CHECK(type IN ('goods', 'services', 'meta'))
-        );
-    ''')
-
-    # --- Create Products Table ---
-    cursor.execute('''
-        CREATE TABLE products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price TEXT NOT NULL,         -- Storing as TEXT for flexibility (e.g., "From $X", "$Y/month")
-            image_url TEXT NOT NULL,
-            category_id INTEGER NOT NULL,
-            FOREIGN KEY (category_id) REFERENCES categories (id)
-                ON DELETE RESTRICT -- Prevent deleting category if products exist
-                ON UPDATE CASCADE
-        );
-    ''')
     print("Tables created.")
 
     # --- Populate Categories ---
@@ -97,7 +82,8 @@ def init_db():
     products_to_insert = []
     for name, price, img, cat_slug in products_data:
         if cat_slug in category_map:
-            products_to_insert.append((name, price, img, category_map[cat_slug]))
+            parsed = parse_price(price)
+            products_to_insert.append((name, format_price(*parsed), *parsed, img, category_map[cat_slug]))
         else:
              # Fallback or add a default category like 'uncategorized'/'goods' if needed
              # For now, we skip if slug doesn't match exactly
@@ -110,17 +96,21 @@ def init_db():
     if products_to_insert:
         try:
             cursor.executemany('''
-                INSERT INTO products (name, price, image_url, category_id)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO products (name, price, price_cents, currency, price_is_from, billing_period, image_url, category_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', products_to_insert)
             print(f"{cursor.rowcount} products inserted.")
         except sqlite3.Error as e:
             print(f"Error inserting products: {e}")
 
+    # The search index and facet counts are kept in sync by their triggers
+
     # Commit changes and close connection
     conn.commit()
     conn.close()
     print("Database initialized successfully.")
 
 if __name__ == '__main__':
+    # Recreates the database with seed data. To upgrade an existing database
+    # in place, run `python migrations.py` instead.
     init_db()
@@ -0,0 +1,429 @@
+# migrations.py
+"""
+Versioned, in-place schema migrations for the shop database.
+
+Each migration has a version number and runs once; applied versions are
+recorded in the schema_migrations table. Pending migrations run in order,
+from the command line or when the app starts. Every step is written to be
+safe to re-run, so an interrupted migration simply continues next time.
+
+Migrations never hold the write lock for long: backfills walk the table by
+id in short transactions (CHUNK_SIZE rows each), so in WAL mode the shop
+keeps serving reads throughout and admin writes only wait for one chunk.
+Index builds are single statements; they block writers while they run but
+not readers.
+
+Command line (run from the jobs/ directory):
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending versions
+"""
+import argparse
+import contextlib
+import sqlite3
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, fine for a single dev server
+    fcntl = None
+
+from db_pool import DEFAULT_PRAGMAS
+from pricing import parse_price, format_price
+
+DATABASE = 'database.db'
+
+CHUNK_SIZE = 2000          # Rows per backfill transaction
+CHUNK_PAUSE_SECONDS = 0.01  # Gap between chunks for waiting writers to get the lock
+
+
+@contextlib.contextmanager
+def transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit connection (rolled back on error)."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def backfill_in_chunks(conn, select_sql, apply_chunk, chunk_size):
+    """
+    Walks products in id order, chunk_size rows per transaction:
+    select_sql gets (last_id, limit) and must return id as its first column;
+    apply_chunk(conn, rows, after_id) writes the chunk, which covers the ids
+    in (after_id, rows[-1][0]]. Keeps going until a select comes back empty,
+    so rows inserted meanwhile are covered too.
+    Returns the number of rows processed.
+    """
+    last_id, total = 0, 0
+    while True:
+        with transaction(conn):
+            rows = conn.execute(select_sql, (last_id, chunk_size)).fetchall()
+            if rows:
+                apply_chunk(conn, rows, last_id)
+        if not rows:
+            return total
+        last_id = rows[-1][0]
+        total += len(rows)
+        time.sleep(CHUNK_PAUSE_SECONDS)
+
+
+# --- Migrations ---
+
+def create_catalog_tables(conn, chunk_size):
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                slug TEXT NOT NULL UNIQUE,
+                type TEXT NOT NULL CHECK(type IN ('goods', 'services', 'meta'))
+            );
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                price TEXT NOT NULL,         -- Display string (e.g., "From $X", "$Y/month"), built by pricing.format_price
+                image_url TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                FOREIGN KEY (category_id) REFERENCES categories (id)
+                    ON DELETE RESTRICT -- Prevent deleting category if products exist
+                    ON UPDATE CASCADE
+            );
+        ''')
+    # Keyset pagination on (name, id): unfiltered and meta-type ('goods'/'services')
+    # listings walk the first index in order; a single category is one range of the second
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name_id ON products (name, id);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category_name_id ON products (category_id, name, id);')
+
+
+def add_structured_prices(conn, chunk_size):
+    """Structured price columns, filled in by parsing each row's price string."""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(products)')}
+    new_columns = [
+        ('price_cents', "INTEGER NOT NULL DEFAULT 0 CHECK(price_cents >= 0)"),
+        ('currency', "TEXT NOT NULL DEFAULT 'USD'"),
+        ('price_is_from', "INTEGER NOT NULL DEFAULT 0 CHECK(price_is_from IN (0, 1))"),
+        ('billing_period', "TEXT CHECK(billing_period IN ('month', 'year'))"),  # NULL for one-off prices
+    ]
+    for column, definition in new_columns:
+        if column not in existing:
+            # Only rewrites the schema, not the rows
+            conn.execute(f'ALTER TABLE products ADD COLUMN {column} {definition}')
+
+    def apply_chunk(conn, rows, after_id):
+        updates = []
+        for prod_id, name, price in rows:
+            try:
+                parsed = parse_price(price)
+            except ValueError:
+                print(f"Warning: Could not parse price '{price}' for product '{name}' (ID {prod_id}). Leaving it at 0.")
+                continue
+            updates.append((format_price(*parsed), *parsed, prod_id))
+        conn.executemany('''
+            UPDATE products
+            SET price = ?, price_cents = ?, currency = ?, price_is_from = ?, billing_period = ?
+            WHERE id = ?
+        ''', updates)
+
+    # Rows still at 0 cents are the ones not parsed yet (re-parsing a free product is harmless)
+    backfill_in_chunks(conn, '''
+        SELECT id, name, price FROM products WHERE id > ? AND price_cents = 0 ORDER BY id LIMIT ?
+    ''', apply_chunk, chunk_size)
+
+    # Sorting by price and filtering on a price range, with keyset pagination
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_price_id ON products (price_cents, id);')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category_price_id ON products (category_id, price_cents, id);')
+
+
+def create_search_index(conn, chunk_size):
+    """
+    FTS5 index over product and category names, plus the triggers that keep
+    it in sync with the products/categories tables.
+    """
+    with transaction(conn):
+        # rowid = products.id. prefix='2 3' adds prefix indexes so autocomplete
+        # lookups ("ip"*, "mac"*) don't have to scan the whole term list.
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name,
+                category_name,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            );
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name, category_name)
+                SELECT new.id, new.name, c.name FROM categories c WHERE c.id = new.category_id;
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+                DELETE FROM products_fts WHERE rowid = old.id;
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, category_id ON products BEGIN
+                DELETE FROM products_fts WHERE rowid = old.id;
+                INSERT INTO products_fts (rowid, name, category_name)
+                SELECT new.id, new.name, c.name FROM categories c WHERE c.id = new.category_id;
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS categories_fts_rename AFTER UPDATE OF name ON categories BEGIN
+                UPDATE products_fts SET category_name = new.name
+                WHERE rowid IN (SELECT id FROM products WHERE category_id = new.id);
+            END;
+        ''')
+
+    # The triggers cover every write from here on; fill in the rows that were
+    # already there. Each chunk replaces the index entries for its whole id
+    # range in one transaction, so rows a trigger (or an earlier run) already
+    # indexed are not duplicated
+    def apply_chunk(conn, rows, after_id):
+        conn.execute('DELETE FROM products_fts WHERE rowid > ? AND rowid <= ?', (after_id, rows[-1][0]))
+        conn.executemany('INSERT INTO products_fts (rowid, name, category_name) VALUES (?, ?, ?)', rows)
+
+    backfill_in_chunks(conn, '''
+        SELECT p.id, p.name, c.name FROM products p JOIN categories c ON p.category_id = c.id
+        WHERE p.id > ? ORDER BY p.id LIMIT ?
+    ''', apply_chunk, chunk_size)
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize');")
+
+
+def create_facet_counts(conn, chunk_size):
+    """
+    Materialized product counts behind the shop's category facets, plus the
+    triggers that keep them current on every product/category write (admin
+    routes and bulk imports alike).
+    - category_counts: products filed directly under each category.
+    - type_counts: products per category type ('goods'/'services'/'meta').
+    The initial counts are one GROUP BY, done in the same transaction as the
+    triggers so no write can slip in between.
+    """
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS category_counts (
+                category_id INTEGER PRIMARY KEY REFERENCES categories (id) ON DELETE CASCADE,
+                product_count INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS type_counts (
+                type TEXT PRIMARY KEY,
+                product_count INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS facet_counts_product_insert AFTER INSERT ON products BEGIN
+                UPDATE category_counts SET product_count = product_count + 1 WHERE category_id = new.category_id;
+                UPDATE type_counts SET product_count = product_count + 1
+                WHERE type = (SELECT type FROM categories WHERE id = new.category_id);
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS facet_counts_product_delete AFTER DELETE ON products BEGIN
+                UPDATE category_counts SET product_count = product_count - 1 WHERE category_id = old.category_id;
+                UPDATE type_counts SET product_count = product_count - 1
+                WHERE type = (SELECT type FROM categories WHERE id = old.category_id);
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS facet_counts_product_move AFTER UPDATE OF category_id ON products
+            WHEN old.category_id IS NOT new.category_id BEGIN
+                UPDATE category_counts SET product_count = product_count - 1 WHERE category_id = old.category_id;
+                UPDATE type_counts SET product_count = product_count - 1
+                WHERE type = (SELECT type FROM categories WHERE id = old.category_id);
+                UPDATE category_counts SET product_count = product_count + 1 WHERE category_id = new.category_id;
+                UPDATE type_counts SET product_count = product_count + 1
+                WHERE type = (SELECT type FROM categories WHERE id = new.category_id);
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS facet_counts_category_insert AFTER INSERT ON categories BEGIN
+                INSERT OR IGNORE INTO category_counts (category_id, product_count) VALUES (new.id, 0);
+                INSERT OR IGNORE INTO type_counts (type, product_count) VALUES (new.type, 0);
+            END;
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS facet_counts_category_delete AFTER DELETE ON categories BEGIN
+                DELETE FROM category_counts WHERE category_id = old.id;
+            END;
+        ''')
+        # A category changing type carries its products over to the new type's total
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS facet_counts_category_retype AFTER UPDATE OF type ON categories
+            WHEN old.type IS NOT new.type BEGIN
+                INSERT OR IGNORE INTO type_counts (type, product_count) VALUES (new.type, 0);
+                UPDATE type_counts SET product_count = product_count -
+                    (SELECT product_count FROM category_counts WHERE category_id = new.id)
+                WHERE type = old.type;
+                UPDATE type_counts SET product_count = product_count +
+                    (SELECT product_count FROM category_counts WHERE category_id = new.id)
+                WHERE type = new.type;
+            END;
+        ''')
+        conn.execute('DELETE FROM category_counts;')
+        conn.execute('''
+            INSERT INTO category_counts (category_id, product_count)
+            SELECT c.id, COUNT(p.id) FROM categories c LEFT JOIN products p ON p.category_id = c.id GROUP BY c.id;
+        ''')
+        conn.execute('DELETE FROM type_counts;')
+        conn.execute('''
+            INSERT INTO type_counts (type, product_count)
+            SELECT c.type, SUM(cc.product_count) FROM categories c
+            JOIN category_counts cc ON cc.category_id = c.id GROUP BY c.type;
+        ''')
+
+
+def create_change_feed(conn, chunk_size):
+    """
+    Change tracking behind /api/changes: catalog_changes holds one row per
+    product/category with the revision of its latest insert, update or
+    delete (deleted = 1 marks a tombstone). Revisions come from
+    AUTOINCREMENT, so they only ever grow and are never reused; INSERT OR
+    REPLACE moves an entity's row to a fresh revision on every write.
+    Triggers record every write, from the admin routes and imports alike.
+    """
+    with transaction(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_changes (
+                revision INTEGER PRIMARY KEY AUTOINCREMENT,
+                entity TEXT NOT NULL CHECK(entity IN ('product', 'category')),
+                entity_id INTEGER NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0 CHECK(deleted IN (0, 1)),
+                UNIQUE (entity, entity_id)
+            );
+        ''')
+        for table, entity in (('products', 'product'), ('categories', 'category')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_insert AFTER INSERT ON {table} BEGIN
+                    INSERT OR REPLACE INTO catalog_changes (entity, entity_id, deleted) VALUES ('{entity}', new.id, 0);
+                END;
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_update AFTER UPDATE ON {table} BEGIN
+                    INSERT OR REPLACE INTO catalog_changes (entity, entity_id, deleted) VALUES ('{entity}', new.id, 0);
+                END;
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_delete AFTER DELETE ON {table} BEGIN
+                    INSERT OR REPLACE INTO catalog_changes (entity, entity_id, deleted) VALUES ('{entity}', old.id, 1);
+                END;
+            ''')
+        conn.execute('''
+            INSERT OR IGNORE INTO catalog_changes (entity, entity_id) SELECT 'category', id FROM categories ORDER BY id;
+        ''')
+
+    # Give every existing product a revision. OR IGNORE keeps the newer
+    # revision of rows a trigger has already recorded
+    def apply_chunk(conn, rows, after_id):
+        conn.executemany("INSERT OR IGNORE INTO catalog_changes (entity, entity_id) VALUES ('product', ?)", rows)
+
+    backfill_in_chunks(conn, 'SELECT id FROM products WHERE id > ? ORDER BY id LIMIT ?', apply_chunk, chunk_size)
+
+
+# (version, name, function) in the order they apply. Append new migrations
+# here; never renumber or edit one that has shipped.
+MIGRATIONS = [
+    (1, 'create_catalog_tables', create_catalog_tables),
+    (2, 'add_structured_prices', add_structured_prices),
+    (3, 'create_search_index', create_search_index),
+    (4, 'create_facet_counts', create_facet_counts),
+    (5, 'create_change_feed', create_change_feed),
+]
+
+
+# --- Runner ---
+
+def connect(database):
+    """An autocommit connection (migrations manage their own transactions), tuned like the app's."""
+    conn = sqlite3.connect(database, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for name, value in DEFAULT_PRAGMAS.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+    ''')
+    return conn
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+@contextlib.contextmanager
+def migration_lock(database):
+    """Lets only one process (e.g. one of several app workers starting together) migrate at a time."""
+    if fcntl is None:
+        yield
+        return
+    with open(database + '.migrate.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate(database=DATABASE, chunk_size=CHUNK_SIZE, verbose=True):
+    """Applies every pending migration in order. Returns the versions applied."""
+    applied_now = []
+    with migration_lock(database):
+        conn = connect(database)
+        try:
+            done = applied_versions(conn)  # Read under the lock: another process may just have finished
+            for version, name, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                if verbose:
+                    print(f"Applying migration {version}: {name}...")
+                start = time.perf_counter()
+                apply(conn, chunk_size)
+                conn.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+                applied_now.append(version)
+                if verbose:
+                    print(f"Migration {version} done in {time.perf_counter() - start:.1f}s.")
+        finally:
+            conn.close()
+    return applied_now
+
+
+def pending_migrations(database=DATABASE):
+    conn = connect(database)
+    try:
+        done = applied_versions(conn)
+    finally:
+        conn.close()
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in done]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the shop database.")
+    parser.add_argument('--database', default=DATABASE, help=f"SQLite database file (default: {DATABASE})")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows per backfill transaction")
+    parser.add_argument('--status', action='store_true', help="List pending migrations without applying them")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        pending = pending_migrations(args.database)
+        for version, name in pending:
+            print(f"Pending: {version} {name}")
+        print(f"{len(MIGRATIONS) - len(pending)} applied, {len(pending)} pending.")
+        return 0
+    applied = migrate(args.database, chunk_size=args.chunk_size)
+    print(f"Applied {len(applied)} migrations." if applied else "Database is up to date.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
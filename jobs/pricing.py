@@ -0,0 +1,65 @@
+# pricing.py
+import re
+from collections import namedtuple
+
+# Structured form of a product price. `amount_cents` is what the shop sorts and
+# range-filters on; the display string ("From $999", "$10.99/month") is always
+# rebuilt from these fields by format_price().
+Price = namedtuple('Price', ['amount_cents', 'currency', 'is_from', 'billing_period'])
+
+DEFAULT_CURRENCY = 'USD'
+CURRENCY_SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£'}
+SYMBOL_CURRENCIES = {symbol: code for code, symbol in CURRENCY_SYMBOLS.items()}
+BILLING_PERIODS = {'month': 'month', 'mo': 'month', 'year': 'year', 'yr': 'year'}
+
+_PRICE_RE = re.compile(r'''
+    ^\s*
+    (?P<from>from\s+)?
+    (?:(?P<symbol>[$€£])|(?P<code>[A-Z]{3})\s*)?
+    (?P<whole>\d+)(?:\.(?P<frac>\d{1,2}))?
+    \s*(?:/\s*(?P<period>month|mo|year|yr))?
+    \s*$
+''', re.IGNORECASE | re.VERBOSE)
+
+
+def parse_price(text):
+    """
+    Parses a display price such as "From $999" or "$10.99/month" into a Price.
+    Raises ValueError if the text is not in a recognized format.
+    """
+    match = _PRICE_RE.match(text or '')
+    if not match:
+        raise ValueError(f"Unrecognized price format: {text!r}")
+
+    if match.group('symbol'):
+        currency = SYMBOL_CURRENCIES[match.group('symbol')]
+    elif match.group('code'):
+        currency = match.group('code').upper()
+    else:
+        currency = DEFAULT_CURRENCY
+
+    cents = int(match.group('whole')) * 100 + int((match.group('frac') or '0').ljust(2, '0'))
+    period = match.group('period')
+    return Price(cents, currency, bool(match.group('from')),
+                 BILLING_PERIODS[period.lower()] if period else None)
+
+
+def format_price(amount_cents, currency=DEFAULT_CURRENCY, is_from=False, billing_period=None):
+    """Builds the display string for a structured price (the inverse of parse_price)."""
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    dollars, cents = divmod(amount_cents, 100)
+    amount = f"{dollars}" if cents == 0 else f"{dollars}.{cents:02d}"
+    text = f"{symbol}{amount}" if symbol else f"{currency} {amount}"
+    if is_from:
+        text = f"From {text}"
+    if billing_period:
+        text = f"{text}/{billing_period}"
+    return text
+
+
+def parse_amount(text):
+    """Parses a plain amount such as "10" or "10.99" (e.g. a price filter bound) into cents."""
+    match = re.fullmatch(r'\s*(\d+)(?:\.(\d{1,2}))?\s*', text or '')
+    if not match:
+        raise ValueError(f"Invalid amount: {text!r}")
+    return int(match.group(1)) * 100 + int((match.group(2) or '0').ljust(2, '0'))
@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const productGrid = document.getElementById('product-grid');
     const categoryList = document.getElementById('category-list');
     const paginationControls = document.getElementById('pagination-controls');
+    const listingOptions = document.getElementById('listing-options'); // Sort / price range form
 
     // Ensure elements exist before proceeding
     if (!productGrid || !categoryList || !paginationControls) {
@@ -9,112 +10,218 @@ document.addEventListener('DOMContentLoaded', () => {
         return;
     }
 
-    const allProductCards = Array.from(productGrid.children); // Get all initial product cards
-    let currentFilter = 'all';
-    let currentPage = 1;
-    const itemsPerPage = 8; // Adjust as needed
-
-    // --- Filtering Logic ---
-    const filterProducts = () => {
-        // 1. Update active button style
-        categoryList.querySelectorAll('button').forEach(button => {
-            button.classList.remove('active');
-            if (button.dataset.filter === currentFilter) {
-                button.classList.add('active');
-            }
-        });
-
-        // 2. Filter visibility based on currentFilter
-        allProductCards.forEach(card => {
-            const categories = card.dataset.category ? card.dataset.category.split(' ') : [];
-            const matchesFilter = currentFilter === 'all' || categories.includes(currentFilter);
-
-            // Hide or show based *only* on filter first
-            card.classList.toggle('hidden', !matchesFilter);
-        });
-
-         // 3. Reset to page 1 and apply pagination to the *newly filtered* items
-        currentPage = 1;
-        applyPagination();
+    // Filtering and pagination happen on the server. The page works without JS
+    // (plain links); this script only swaps in pages fetched from /api/products
+    // so that clicking around doesn't reload the whole document.
+    let currentFilter = productGrid.dataset.filter || 'all';
+
+    // --- Rendering ---
+    // Resized product images (/images/<width>/...), mirroring image_srcset() in app.py
+    const imagePrefix = '/static/images/';
+    const imageWidths = (productGrid.dataset.imageWidths || '').split(',').filter(Boolean).map(Number);
+    const defaultImageWidth = 320;
+    const variantUrl = (url, width) => (imageWidths.length && url.startsWith(imagePrefix))
+        ? `/images/${width}/${url.slice(imagePrefix.length)}`
+        : url;
+
+    const capitalize = (text) => text ? text.charAt(0).toUpperCase() + text.slice(1) : '';
+
+    const renderCard = (product) => {
+        const card = document.createElement('div');
+        card.className = 'product-card';
+        card.dataset.category = `${product.category_slug} ${product.category_type}`;
+
+        const img = document.createElement('img');
+        img.src = variantUrl(product.image_url, defaultImageWidth);
+        if (imageWidths.length && product.image_url.startsWith(imagePrefix)) {
+            img.srcset = imageWidths.map(width => `${variantUrl(product.image_url, width)} ${width}w`).join(', ');
+            img.sizes = '(max-width: 600px) 50vw, 25vw';
+        }
+        img.loading = 'lazy';
+        img.alt = product.name;
+        card.appendChild(img);
+
+        const title = document.createElement('h3');
+        title.textContent = product.name;
+        card.appendChild(title);
+
+        const category = document.createElement('p');
+        category.className = 'product-category';
+        category.textContent = `${capitalize(product.category_type)} / ${product.category_name}`;
+        card.appendChild(category);
+
+        const price = document.createElement('p');
+        price.className = 'product-price';
+        price.textContent = product.price;
+        card.appendChild(price);
+
+        const buyButton = document.createElement('button');
+        buyButton.className = 'buy-button';
+        buyButton.textContent = 'Buy';
+        card.appendChild(buyButton);
+
+        return card;
     };
 
-    // Add event listener to category buttons
-    categoryList.addEventListener('click', (event) => {
-        if (event.target.tagName === 'BUTTON' && event.target.dataset.filter) {
-            currentFilter = event.target.dataset.filter;
-            filterProducts();
+    const renderProducts = (products) => {
+        productGrid.innerHTML = '';
+        if (products.length === 0) {
+            const empty = document.createElement('p');
+            empty.textContent = 'No products found.';
+            productGrid.appendChild(empty);
+            return;
         }
-    });
+        products.forEach(product => productGrid.appendChild(renderCard(product)));
+    };
 
+    const renderPaginationControls = (prevCursor, nextCursor) => {
+        paginationControls.innerHTML = ''; // Clear existing controls
 
-    // --- Pagination Logic ---
-    const applyPagination = () => {
-        // Get only the cards currently *visible* after filtering
-        const visibleCards = allProductCards.filter(card => !card.classList.contains('hidden'));
-        const totalItems = visibleCards.length;
-        const totalPages = Math.ceil(totalItems / itemsPerPage);
+        if (prevCursor) {
+            const prevLink = document.createElement('a');
+            prevLink.href = shopUrl({ before: prevCursor });
+            prevLink.dataset.before = prevCursor;
+            prevLink.innerHTML = '« Prev';
+            paginationControls.appendChild(prevLink);
+        }
+        if (nextCursor) {
+            const nextLink = document.createElement('a');
+            nextLink.href = shopUrl({ after: nextCursor });
+            nextLink.dataset.after = nextCursor;
+            nextLink.innerHTML = 'Next »';
+            paginationControls.appendChild(nextLink);
+        }
+    };
 
-        // Hide all visible cards initially (before showing the current page's cards)
-        visibleCards.forEach(card => card.classList.add('hidden'));
+    const updateActiveFilter = () => {
+        categoryList.querySelectorAll('a[data-filter]').forEach(link => {
+            link.classList.toggle('active', link.dataset.filter === currentFilter);
+        });
+    };
 
-        // Calculate cards for the current page
-        const startIndex = (currentPage - 1) * itemsPerPage;
-        const endIndex = startIndex + itemsPerPage;
-        const cardsToShow = visibleCards.slice(startIndex, endIndex);
+    // --- Data Loading ---
+    const optionNames = ['sort', 'min_price', 'max_price'];
 
-        // Show only the cards for the current page
-        cardsToShow.forEach(card => card.classList.remove('hidden'));
+    const readOptions = () => {
+        const options = {};
+        if (listingOptions) {
+            optionNames.forEach(name => { options[name] = listingOptions.elements[name].value; });
+        }
+        return options;
+    };
 
-        // Update pagination controls
-        renderPaginationControls(totalPages);
+    const restoreOptions = (options) => {
+        if (!listingOptions || !options) return;
+        optionNames.forEach(name => { listingOptions.elements[name].value = options[name] || ''; });
+        listingOptions.elements['category'].value = currentFilter;
     };
 
-    const renderPaginationControls = (totalPages) => {
-        paginationControls.innerHTML = ''; // Clear existing controls
+    const buildQuery = (cursor) => {
+        const params = new URLSearchParams({ category: currentFilter });
+        Object.entries(readOptions()).forEach(([name, value]) => {
+            if (value) params.set(name, value);
+        });
+        if (cursor.after) params.set('after', cursor.after);
+        if (cursor.before) params.set('before', cursor.before);
+        return params.toString();
+    };
 
-        if (totalPages <= 1) return; // No controls needed for 1 page
+    const shopUrl = (cursor) => `${window.location.pathname}?${buildQuery(cursor)}`;
 
-        // Previous Button
-        const prevButton = document.createElement('button');
-        prevButton.innerHTML = '« Prev';
-        prevButton.disabled = currentPage === 1;
-        prevButton.addEventListener('click', () => {
-            if (currentPage > 1) {
-                currentPage--;
-                applyPagination();
+    const loadPage = async (cursor, pushHistory = true) => {
+        try {
+            const response = await fetch(`/api/products?${buildQuery(cursor)}`, {
+                headers: { 'Accept': 'application/json' },
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
             }
-        });
-        paginationControls.appendChild(prevButton);
-
-        // Page Number Indicators (simplified for brevity, could add more complex logic for many pages)
-        for (let i = 1; i <= totalPages; i++) {
-            const pageSpan = document.createElement('span');
-            pageSpan.textContent = i;
-            if (i === currentPage) {
-                pageSpan.classList.add('active');
-            } else {
-                pageSpan.addEventListener('click', () => {
-                    currentPage = i;
-                    applyPagination();
-                });
+            const page = await response.json();
+            renderProducts(page.products);
+            renderPaginationControls(page.prev_cursor, page.next_cursor);
+            updateActiveFilter();
+            if (pushHistory) {
+                history.pushState({ filter: currentFilter, cursor, options: readOptions() }, '', shopUrl(cursor));
             }
-            paginationControls.appendChild(pageSpan);
+        } catch (error) {
+            // Fall back to a full page load, which always works
+            console.error('Failed to load products, falling back to navigation:', error);
+            window.location.href = shopUrl(cursor);
         }
+    };
 
-        // Next Button
-        const nextButton = document.createElement('button');
-        nextButton.innerHTML = 'Next »';
-        nextButton.disabled = currentPage === totalPages;
-        nextButton.addEventListener('click', () => {
-            if (currentPage < totalPages) {
-                currentPage++;
-                applyPagination();
-            }
+    // --- Event Listeners ---
+    categoryList.addEventListener('click', (event) => {
+        const link = event.target.closest('a[data-filter]');
+        if (!link) return;
+        event.preventDefault();
+        currentFilter = link.dataset.filter;
+        if (listingOptions) listingOptions.elements['category'].value = currentFilter;
+        loadPage({});
+    });
+
+    if (listingOptions) {
+        listingOptions.addEventListener('submit', (event) => {
+            event.preventDefault();
+            loadPage({});
         });
-        paginationControls.appendChild(nextButton);
+    }
+
+    paginationControls.addEventListener('click', (event) => {
+        const link = event.target.closest('a');
+        if (!link) return;
+        event.preventDefault();
+        loadPage({ after: link.dataset.after, before: link.dataset.before });
+    });
+
+    window.addEventListener('popstate', (event) => {
+        if (!event.state) return;
+        currentFilter = event.state.filter;
+        restoreOptions(event.state.options);
+        loadPage(event.state.cursor, false);
+    });
+
+    // --- Search Autocomplete ---
+    const searchInput = document.getElementById('search-input');
+    const searchSuggestions = document.getElementById('search-suggestions');
+    const minAutocompleteChars = 2; // The server ignores shorter prefixes
+    let autocompleteTimer = null;
+
+    const loadSuggestions = async (text) => {
+        try {
+            const response = await fetch(`/api/autocomplete?${new URLSearchParams({ q: text })}`);
+            if (!response.ok) return;
+            const data = await response.json();
+            searchSuggestions.innerHTML = '';
+            data.suggestions.forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.name;
+                searchSuggestions.appendChild(option);
+            });
+        } catch (error) {
+            console.error('Autocomplete request failed:', error);
+        }
     };
 
+    if (searchInput && searchSuggestions) {
+        searchInput.addEventListener('input', () => {
+            clearTimeout(autocompleteTimer);
+            const text = searchInput.value.trim();
+            if (text.length < minAutocompleteChars) {
+                searchSuggestions.innerHTML = '';
+                return;
+            }
+            // Debounce so fast typing sends one request, not one per keystroke
+            autocompleteTimer = setTimeout(() => loadSuggestions(text), 150);
+        });
+    }
+
     // --- Initial Setup ---
-    // Apply initial filter (which is 'all') and pagination on load
-    filterProducts(); // This will also call applyPagination
+    // The first page is already rendered by the server; just record it in history
+    const initialParams = new URLSearchParams(window.location.search);
+    history.replaceState({
+        filter: currentFilter,
+        cursor: { after: initialParams.get('after'), before: initialParams.get('before') },
+        options: readOptions(),
+    }, '', window.location.href);
 });
@@ -0,0 +1,49 @@
+# conftest.py
+"""
+Shared fixtures for the shop tests. Run from the repository root:
+    python -m pytest jobs/tests
+"""
+import importlib
+import os
+import sqlite3
+import sys
+
+import pytest
+
+JOBS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, JOBS_DIR)
+
+
+@pytest.fixture(scope='session')
+def shop(tmp_path_factory):
+    """The shop app on a fresh database (migrated on import) with the 'phones' and 'music' categories."""
+    database = str(tmp_path_factory.mktemp('shop') / 'database.db')
+    os.environ['SHOP_DATABASE'] = database
+    app_module = importlib.import_module('app')
+    app_module.app.config['TESTING'] = True
+
+    conn = sqlite3.connect(database)
+    conn.executemany('INSERT INTO categories (name, slug, type) VALUES (?, ?, ?)',
+                     [('Phones', 'phones', 'goods'), ('Music', 'music', 'services')])
+    conn.commit()
+    conn.close()
+    yield app_module, database
+    app_module.write_pool.close_all()
+    app_module.read_pool.close_all()
+
+
+def add_products(database, products):
+    """Inserts (name, price cents, category slug) rows directly; returns their ids."""
+    conn = sqlite3.connect(database)
+    try:
+        ids = []
+        for name, cents, slug in products:
+            cursor = conn.execute('''
+                INSERT INTO products (name, price, price_cents, currency, price_is_from, billing_period, image_url, category_id)
+                VALUES (?, ?, ?, 'USD', 0, NULL, '/static/images/product1.jpg', (SELECT id FROM categories WHERE slug = ?))
+            ''', (name, f'${cents // 100}', cents, slug))
+            ids.append(cursor.lastrowid)
+        conn.commit()
+        return ids
+    finally:
+        conn.close()
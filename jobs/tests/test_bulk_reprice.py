@@ -0,0 +1,51 @@
+# test_bulk_reprice.py
+"""
+Bulk reprice input validation. Run from the repository root:
+    python -m pytest jobs/tests
+"""
+import sqlite3
+
+import pytest
+
+from conftest import add_products
+
+
+@pytest.fixture(scope='module')
+def product(shop):
+    """A $100 product to reprice."""
+    app_module, database = shop
+    [prod_id] = add_products(database, [('Reprice Phone', 10000, 'phones')])
+    return app_module, database, prod_id
+
+
+def price_cents(database, prod_id):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute('SELECT price_cents FROM products WHERE id = ?', (prod_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def reprice(client, prod_id, percent):
+    response = client.post('/admin/products/bulk',
+                           data={'action': 'reprice', 'product_ids': str(prod_id), 'percent': percent})
+    with client.session_transaction() as session:
+        flashes = session.pop('_flashes', [])
+    return response, flashes
+
+
+@pytest.mark.parametrize('percent', ['nan', 'NaN', 'inf', '-inf', 'infinity', '1e308', '1e309', '1001', '-101'])
+def test_reprice_rejects_non_finite_and_out_of_range_percentages(product, percent):
+    app_module, database, prod_id = product
+    response, flashes = reprice(app_module.app.test_client(), prod_id, percent)
+    assert response.status_code == 302
+    assert [category for category, _ in flashes] == ['error']
+    assert price_cents(database, prod_id) == 10000
+
+
+def test_reprice_applies_a_valid_percentage(product):
+    app_module, database, prod_id = product
+    response, flashes = reprice(app_module.app.test_client(), prod_id, '-10')
+    assert response.status_code == 302
+    assert [category for category, _ in flashes] == ['success']
+    assert price_cents(database, prod_id) == 9000
@@ -0,0 +1,48 @@
+# test_changes.py
+"""
+Change feed robustness against orphan products, and the check that keeps them out. Run from the repository root:
+    python -m pytest jobs/tests
+"""
+import sqlite3
+
+from conftest import add_products
+
+
+def test_feed_survives_a_product_without_a_category_row(shop):
+    app_module, database = shop
+    [kept_id] = add_products(database, [('Feed Phone', 50000, 'phones')])
+    conn = sqlite3.connect(database)
+    orphan_id = conn.execute('''
+        INSERT INTO products (name, price, price_cents, currency, price_is_from, billing_period, image_url, category_id)
+        VALUES ('Orphan', '$1', 100, 'USD', 0, NULL, '/static/images/product1.jpg', 999)
+    ''').lastrowid
+    conn.commit()
+    conn.close()
+
+    client = app_module.app.test_client()
+    response = client.get('/api/changes?since=0')
+    assert response.status_code == 200
+    changes = {(change['type'], change['id']): change for change in response.get_json()['changes']}
+    assert changes['product', kept_id]['product']['category_slug'] == 'phones'
+    orphan = changes['product', orphan_id]
+    assert not orphan['deleted']
+    assert orphan['product']['name'] == 'Orphan'
+    assert orphan['product']['category_slug'] is None
+    # And the polls after it keep working
+    assert client.get(f"/api/changes?since={response.get_json()['revision']}").status_code == 200
+
+
+def test_add_product_rejects_an_unknown_category(shop):
+    app_module, database = shop
+    client = app_module.app.test_client()
+    response = client.post('/admin/products/add', data={'name': 'Ghost', 'price': '$5',
+                                                       'image_url': '/static/images/product1.jpg', 'category_id': '999'})
+    with client.session_transaction() as session:
+        flashes = session.pop('_flashes', [])
+    assert response.status_code == 302
+    assert [category for category, _ in flashes] == ['error']
+    conn = sqlite3.connect(database)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM products WHERE name = 'Ghost'").fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,41 @@
+# test_images.py
+"""
+Resized product image responses. Run from the repository root:
+    python -m pytest jobs/tests
+"""
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def images(shop, tmp_path, monkeypatch):
+    """The shop serving variants of one 800px JPEG from a cache in tmp_path."""
+    app_module, _ = shop
+    from image_cache import ImageVariantCache
+    source_dir = tmp_path / 'images'
+    source_dir.mkdir()
+    Image.new('RGB', (800, 600), (200, 30, 30)).save(source_dir / 'red.jpg', 'JPEG')
+    monkeypatch.setattr(app_module, 'image_cache',
+                        ImageVariantCache(str(source_dir), str(tmp_path / 'cache'), 10 * 1024 * 1024))
+    return app_module.app.test_client()
+
+
+def test_variant_is_sent_with_its_length(images):
+    response = images.get('/images/320/red.jpg', headers={'Accept': 'image/webp'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert response.content_length == len(response.data) > 0
+
+
+def test_not_modified_has_no_variant_length(shop, images):
+    app_module, _ = shop
+    etag = images.get('/images/320/red.jpg').headers['ETag']
+    # Called directly: the WSGI layer would strip the header from a 304 anyway
+    with app_module.app.test_request_context('/images/320/red.jpg', headers={'If-None-Match': etag}):
+        response = app_module.product_image(320, 'red.jpg')
+    try:
+        assert response.status_code == 304
+        assert response.content_length in (None, 0)
+    finally:
+        response.close()
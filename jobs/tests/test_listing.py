@@ -0,0 +1,46 @@
+# test_listing.py
+"""
+Product listing order and paging with price ranges. Run from the repository root:
+    python -m pytest jobs/tests
+"""
+import sqlite3
+
+import pytest
+
+from conftest import add_products
+
+
+@pytest.fixture(scope='module')
+def listing(shop):
+    """A category of its own whose name order and price order differ."""
+    app_module, database = shop
+    conn = sqlite3.connect(database)
+    conn.execute("INSERT INTO categories (name, slug, type) VALUES ('Cables', 'cables', 'goods')")
+    conn.commit()
+    conn.close()
+    add_products(database, [('Cable A', 3000, 'cables'), ('Cable B', 1000, 'cables'),
+                            ('Cable C', 2000, 'cables'), ('Cable D', 9000, 'cables')])
+    return app_module.app.test_client()
+
+
+def names(response):
+    assert response.status_code == 200
+    return [product['name'] for product in response.get_json()['products']]
+
+
+def test_price_range_defaults_to_price_order(listing):
+    response = listing.get('/api/products?category=cables&min_price=5&max_price=50')
+    assert names(response) == ['Cable B', 'Cable C', 'Cable A']
+
+
+def test_price_range_honors_explicit_name_order(listing):
+    response = listing.get('/api/products?category=cables&min_price=5&max_price=50&sort=name')
+    assert names(response) == ['Cable A', 'Cable B', 'Cable C']
+
+
+def test_price_range_name_order_pages_by_name_cursor(listing):
+    first = listing.get('/api/products?category=cables&min_price=5&max_price=50&sort=name&limit=2')
+    assert names(first) == ['Cable A', 'Cable B']
+    cursor = first.get_json()['next_cursor']
+    rest = listing.get(f'/api/products?category=cables&min_price=5&max_price=50&sort=name&limit=2&after={cursor}')
+    assert names(rest) == ['Cable C']
@@ -0,0 +1,35 @@
+# test_search.py
+"""
+Full-text search and autocomplete over partly typed queries. Run from the repository root:
+    python -m pytest jobs/tests
+"""
+import pytest
+
+from conftest import add_products
+
+
+@pytest.fixture(scope='module')
+def search(shop):
+    app_module, database = shop
+    add_products(database, [('MacBook Pro M3', 159900, 'phones'), ('MacBook Air M3', 109900, 'phones'),
+                            ('Apple Music', 1099, 'music')])
+    return app_module.app.test_client()
+
+
+def found(response, key='products'):
+    assert response.status_code == 200
+    return sorted(item['name'] for item in response.get_json()[key])
+
+
+def test_search_matches_every_word_as_a_prefix(search):
+    assert found(search.get('/api/search?q=mac pro')) == ['MacBook Pro M3']
+    assert found(search.get('/api/search?q=macb m3')) == ['MacBook Air M3', 'MacBook Pro M3']
+
+
+def test_search_ignores_fts_syntax(search):
+    assert found(search.get('/api/search?q=mac" pro*(')) == ['MacBook Pro M3']
+    assert found(search.get('/api/search?q=mac OR music')) == []  # OR is just another word
+
+
+def test_autocomplete_matches_partial_words(search):
+    assert found(search.get('/api/autocomplete?q=mac ai'), key='suggestions') == ['MacBook Air M3']
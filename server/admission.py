@@ -0,0 +1,136 @@
+# admission.py
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+HIGH_PRIORITY = "high"
+LOW_PRIORITY = "low"
+
+
+class RoutePolicy(NamedTuple):
+    max_in_flight: int                    # Concurrent requests allowed on this route
+    priority: str = LOW_PRIORITY          # Low-priority routes are shed first under overall load
+    ip_rate: Optional[Tuple[float, float]] = None  # (requests per second, burst) per client IP
+
+
+class KeyedRateLimiter:
+    """
+    One token bucket per key (client IP, username, ...). At most `max_keys`
+    buckets are kept; the least recently used are forgotten first, which
+    only ever makes the limiter more lenient.
+
+    Not thread-safe: meant to be used from the event loop only.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+
+    def acquire(self, key, now: Optional[float] = None) -> float:
+        """Takes a token for `key`. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+
+def client_ip(scope) -> str:
+    """
+    The client's address. Behind the local nginx proxy every peer is
+    127.0.0.1, so X-Real-IP (set by nginx) is used when the peer is loopback.
+    """
+    peer = (scope.get("client") or ("unknown", 0))[0]
+    if peer in ("127.0.0.1", "::1"):
+        for name, value in scope.get("headers", ()):
+            if name == b"x-real-ip":
+                return value.decode("latin-1")
+    return peer
+
+
+class AdmissionMiddleware:
+    """
+    Plain ASGI middleware that turns requests away quickly instead of
+    letting them queue when the service is overloaded:
+
+    - a per-route cap on requests in flight (503 + Retry-After),
+    - low-priority (expensive) routes are also shed once the whole worker
+      has `low_priority_ceiling` requests in flight, leaving the remaining
+      capacity to high-priority (cheap) routes like /session,
+    - a token bucket per client IP and route (429 + Retry-After).
+
+    Paths without a policy use `default_policy`. Everything runs on the
+    event loop between awaits, so the counters need no locks.
+    """
+
+    def __init__(self, app, policies: Dict[str, RoutePolicy], default_policy: RoutePolicy,
+                 low_priority_ceiling: int, on_reject=None):
+        self.app = app
+        self.policies = policies
+        self.default_policy = default_policy
+        self.low_priority_ceiling = low_priority_ceiling
+        self.on_reject = on_reject  # Called with (route, reason) for every rejected request
+        self.in_flight = 0
+        self._route_in_flight = {}
+        self._ip_limiters = {route: KeyedRateLimiter(*policy.ip_rate)
+                             for route, policy in list(policies.items()) + [(None, default_policy)]
+                             if policy.ip_rate}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = scope["path"] if scope["path"] in self.policies else None
+        policy = self.policies.get(route, self.default_policy)
+        label = route or "other"
+
+        limiter = self._ip_limiters.get(route)
+        if limiter is not None:
+            wait = limiter.acquire(client_ip(scope))
+            if wait:
+                await self._reject(send, label, "rate_limited", 429, wait)
+                return
+        route_in_flight = self._route_in_flight.get(route, 0)
+        if route_in_flight >= policy.max_in_flight:
+            await self._reject(send, label, "route_busy", 503, 1)
+            return
+        if policy.priority == LOW_PRIORITY and self.in_flight >= self.low_priority_ceiling:
+            await self._reject(send, label, "overloaded", 503, 1)
+            return
+
+        self.in_flight += 1
+        self._route_in_flight[route] = route_in_flight + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            self._route_in_flight[route] -= 1
+
+    async def _reject(self, send, route, reason, status_code, retry_after):
+        if self.on_reject is not None:
+            self.on_reject(route, reason)
+        body = json.dumps({"detail": "Too many requests, retry later" if status_code == 429
+                           else "Service busy, retry shortly"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
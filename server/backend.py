@@ -1,24 +1,287 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import marshal
+import math
+import os
 import secrets
+import sys
 import time
-from typing import Optional, Dict
-from fastapi import FastAPI, Request, Response, HTTPException, status, Depends, Header
+from functools import wraps
+from typing import Optional, Dict, List
+from fastapi import FastAPI, Request, Response, HTTPException, status, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware # To allow frontend requests
 from pydantic import BaseModel
+from starlette.routing import Match
+
+from admission import HIGH_PRIORITY, LOW_PRIORITY, AdmissionMiddleware, KeyedRateLimiter, RoutePolicy
+from passwords import HasherSaturated, PasswordHasher, hash_password, params_from_env
+from session_store import CachedSessionStore, MemorySessionStore, SqliteSessionStore
+from signed_sessions import Denylist, SessionSigner, parse_signing_keys
+from structured_log import configure_logging
+
+# metrics.py and profiling.py are shared with the shop and live in common/ (script.sh
+# deploys them next to this file, which is searched first)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from metrics import PROMETHEUS_CONTENT_TYPE, Counter, Gauge, Histogram, Registry  # noqa: E402
+from profiling import SamplingProfiler, install_signal_handler  # noqa: E402
 
 # --- Configuration ---
 SESSION_COOKIE_NAME = "my_app_session_id"
 CSRF_COOKIE_NAME = "my_app_csrf_token"
 SESSION_TTL_SECONDS = 3600  # 1 hour session lifetime
+# Sliding expiry is written back (and cookies re-set) only once this share of the TTL
+# has passed since the last renewal, not on every check
+SESSION_RENEW_FRACTION = float(os.environ.get("AUTH_SESSION_RENEW_FRACTION", "0.1"))
 CSRF_TOKEN_HEADER = "X-CSRF-Token" # Custom header for CSRF token
+SLOW_OPERATION_SECONDS = float(os.environ.get("AUTH_SLOW_OPERATION_MS", "50")) / 1000
+# "store": the session cookie is a random id looked up in the session store below.
+# "signed": the cookie is an HMAC-signed token checked without any store lookup;
+#           needs AUTH_SIGNING_KEYS="kid:secret,..." (first key signs, all verify).
+SESSION_MODE = os.environ.get("AUTH_SESSION_MODE", "store")
+# "sqlite": one session file shared by all Gunicorn workers, behind a short per-worker cache.
+# "memory": sessions live in the worker that created them (single-process dev only).
+SESSION_BACKEND = os.environ.get("AUTH_SESSION_BACKEND", "sqlite")
+SESSION_DB_PATH = os.environ.get("AUTH_SESSION_DB", "sessions.db")
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_SESSION_CACHE_TTL", "2"))
+MAX_SESSIONS = int(os.environ.get("AUTH_MAX_SESSIONS", "100000"))  # The closest to expiry go first
+SESSION_SWEEP_INTERVAL_SECONDS = 1.0
+SESSION_SWEEP_BATCH = 500  # Expired sessions removed per batch before yielding to requests
+PASSWORD_PARAMS = params_from_env()  # scrypt cost; hashes made with other values are upgraded on login
+PASSWORD_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("AUTH_HASH_MAX_PENDING", "16"))  # Queued + running; more get a 503
+# Admission control: past these limits requests are rejected at once (429/503 + Retry-After)
+MAX_IN_FLIGHT = int(os.environ.get("AUTH_MAX_IN_FLIGHT", "128"))  # Beyond this only cheap routes are admitted
+LOGIN_IP_RATE = float(os.environ.get("AUTH_LOGIN_IP_RATE", "2"))  # Login attempts per second per client IP, burst 10
+LOGIN_USER_RATE = float(os.environ.get("AUTH_LOGIN_USER_RATE", "0.2"))  # Per username, burst 5
+ADMISSION_POLICIES = {
+    "/": RoutePolicy(max_in_flight=256, priority=HIGH_PRIORITY, ip_rate=(50, 100)),
+    "/session": RoutePolicy(max_in_flight=256, priority=HIGH_PRIORITY, ip_rate=(50, 100)),
+    "/logout": RoutePolicy(max_in_flight=64, priority=HIGH_PRIORITY, ip_rate=(10, 20)),
+    "/metrics": RoutePolicy(max_in_flight=4, priority=HIGH_PRIORITY),
+    # High priority so a profile can still be taken while the worker is overloaded
+    "/admin/profile": RoutePolicy(max_in_flight=2, priority=HIGH_PRIORITY),
+    # Each login costs a scrypt hash: admit only a little more than the hash pool can queue
+    "/login": RoutePolicy(max_in_flight=PASSWORD_HASH_MAX_PENDING * 2, priority=LOW_PRIORITY,
+                          ip_rate=(LOGIN_IP_RATE, 10)),
+}
+DEFAULT_ADMISSION_POLICY = RoutePolicy(max_in_flight=64, priority=LOW_PRIORITY, ip_rate=(20, 40))
+LOG_LEVEL = os.environ.get("AUTH_LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("AUTH_LOG_DEBUG_SAMPLE", "0.01"))  # Share of DEBUG records kept
+LOG_RATE_PER_SECOND = float(os.environ.get("AUTH_LOG_RATE", "20"))  # Per message template, burst of 50
+# On-demand profiling: SIGUSR2 toggles it (re-reading AUTH_PROFILE_CONFIG), /admin/profile needs the token
+PROFILE_TOKEN = os.environ.get("AUTH_PROFILE_TOKEN")
+PROFILE_DIR = os.environ.get("AUTH_PROFILE_DIR", "profiles")  # Where finished profiles are written
+PROFILE_CONFIG = os.environ.get("AUTH_PROFILE_CONFIG")
+
+# --- Logging ---
+# JSON lines written by a background thread; request handlers only enqueue.
+# Per-request chatter ("validated", "verified") is DEBUG, which is off by
+# default and sampled when on; every message template is also rate limited.
+log, log_handler, log_listener = configure_logging(
+    "auth", level=LOG_LEVEL, sample_rates={logging.DEBUG: LOG_DEBUG_SAMPLE_RATE},
+    per_second=LOG_RATE_PER_SECOND, burst=50)
+
+# --- Profiling ---
+# A sampling profiler (profiling.py) for looking inside a slow route without
+# a redeploy. While off, requests pay one attribute check. Samples on the
+# event loop thread are attributed to the request task that was running.
+profiler = SamplingProfiler(output_dir=PROFILE_DIR)
+install_signal_handler(profiler, PROFILE_CONFIG)
+
+# --- Session Store ---
+# Maps session_id -> {"username": username, "expires": timestamp}. Every store
+# indexes sessions by expiry so a background task can drop the ones nobody
+# looks up again.
+def open_session_store():
+    if SESSION_BACKEND == "memory":
+        return MemorySessionStore(MAX_SESSIONS)
+    if SESSION_BACKEND == "sqlite":
+        return CachedSessionStore(SqliteSessionStore(SESSION_DB_PATH, MAX_SESSIONS), SESSION_CACHE_TTL_SECONDS)
+    raise ValueError(f"Unknown AUTH_SESSION_BACKEND: {SESSION_BACKEND!r} (expected 'sqlite' or 'memory')")
+
+def open_session_signer():
+    keys, active_kid = parse_signing_keys(os.environ.get("AUTH_SIGNING_KEYS", ""))
+    # Revocations are shared through the session file, but only checked in memory
+    denylist = Denylist(SESSION_DB_PATH if SESSION_BACKEND == "sqlite" else None)
+    return SessionSigner(keys, active_kid, SESSION_TTL_SECONDS, denylist)
+
+if SESSION_MODE == "store":
+    session_store, session_signer = open_session_store(), None
+elif SESSION_MODE == "signed":
+    session_store, session_signer = None, open_session_signer()
+else:
+    raise ValueError(f"Unknown AUTH_SESSION_MODE: {SESSION_MODE!r} (expected 'store' or 'signed')")
 
 # --- Simple In-Memory Stores (Replace with DB/Redis in production) ---
-# Store active sessions: {session_id: {"username": username, "expires": timestamp}}
-active_sessions: Dict[str, Dict] = {}
-# Simulated user database
+# Simulated user database: username -> scrypt hash (the demo account's password is "password123")
 mock_users_db = {
-    "user": "hashed_password_placeholder" # In real apps, store hashed passwords
+    "user": hash_password("password123", PASSWORD_PARAMS),
 }
 
+# --- CSRF Secret ---
+# CSRF tokens are an HMAC of the session under this key, so they never need
+# generating or storing, and every worker derives the same token. The key is
+# its own secret, never one of the signing keys: rotating AUTH_SIGNING_KEYS
+# must not invalidate the CSRF tokens of sessions that are still valid.
+def load_csrf_secret() -> bytes:
+    if os.environ.get("AUTH_CSRF_SECRET"):
+        return os.environ["AUTH_CSRF_SECRET"].encode("utf-8")
+    if SESSION_BACKEND == "sqlite":
+        # Created once in the session file, read by every worker (in signed mode
+        # too, where the file only holds revocations otherwise)
+        store = session_store.backend if session_store is not None else SqliteSessionStore(SESSION_DB_PATH, MAX_SESSIONS)
+        return store.shared_secret("csrf")
+    return secrets.token_bytes(32)  # Memory backend: sessions (or revocations) are per-process anyway
+
+csrf_secret = load_csrf_secret()
+
+# Password hashing runs off the event loop in a small, bounded pool
+password_hasher = PasswordHasher(PASSWORD_PARAMS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+# Caps guessing against one account however many IPs the attempts come from
+login_attempts_per_user = KeyedRateLimiter(LOGIN_USER_RATE, 5)
+
+# --- Metrics ---
+# Request and session-store timings, exposed in Prometheus text format on /metrics.
+# Recording is a couple of integer adds; formatting only happens on scrape.
+metrics_registry = Registry()
+request_duration = metrics_registry.register(Histogram(
+    "auth_request_duration_seconds", "Time spent handling HTTP requests, per route.",
+    ("method", "route", "status")))
+store_duration = metrics_registry.register(Histogram(
+    "auth_session_store_duration_seconds", "Time spent in session store operations.",
+    ("operation",)))
+slow_operations = metrics_registry.register(Counter(
+    "auth_slow_operations_total", "Requests and store operations slower than AUTH_SLOW_OPERATION_MS.",
+    ("kind", "name")))
+rejected_requests = metrics_registry.register(Counter(
+    "auth_rejected_requests_total", "Requests turned away by admission control.", ("route", "reason")))
+metrics_registry.register(Gauge(
+    "auth_log_records_dropped_total", "Log records dropped because the log queue was full.",
+    lambda: log_handler.dropped, metric_type="counter"))
+metrics_registry.register(Gauge(
+    "auth_password_hash_pending", "Password hash jobs queued or running.", lambda: password_hasher.pending))
+metrics_registry.register(Gauge(
+    "auth_password_hash_rejected_total", "Logins turned away because the password hash queue was full.",
+    lambda: password_hasher.rejected_total, metric_type="counter"))
+if session_store is not None:
+    metrics_registry.register(Gauge(
+        "auth_sessions_live", "Sessions currently in the session store.", lambda: len(session_store)))
+    metrics_registry.register(Gauge(
+        "auth_sessions_expired_total", "Sessions this worker removed after their TTL ran out.",
+        lambda: session_store.expired_total, metric_type="counter"))
+    metrics_registry.register(Gauge(
+        "auth_sessions_evicted_total", "Sessions this worker evicted early to stay within AUTH_MAX_SESSIONS.",
+        lambda: session_store.evicted_total, metric_type="counter"))
+if session_signer is not None:
+    metrics_registry.register(Gauge(
+        "auth_revoked_sessions", "Revoked signed sessions this worker is still denying.",
+        lambda: len(session_signer.denylist)))
+if isinstance(session_store, CachedSessionStore):
+    metrics_registry.register(Gauge(
+        "auth_session_cache_hits_total", "Session lookups answered by this worker's cache.",
+        lambda: session_store.hits, metric_type="counter"))
+    metrics_registry.register(Gauge(
+        "auth_session_cache_misses_total", "Session lookups that went to the shared store.",
+        lambda: session_store.misses, metric_type="counter"))
+
+def record_store_operation(operation: str, elapsed: float):
+    """Feeds the store histogram and logs the operation if it was slow."""
+    store_duration.observe((operation,), elapsed)
+    if elapsed >= SLOW_OPERATION_SECONDS:
+        slow_operations.inc(("store", operation))
+        log.warning("Slow session store operation", extra={"operation": operation, "ms": round(elapsed * 1000, 1)})
+
+def timed_store_operation(func):
+    """Decorator timing a session store helper under its function name."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_store_operation(func.__name__, time.perf_counter() - start)
+    return wrapper
+
+def route_template(scope) -> str:
+    """The path template of the route the router will pick for `scope`, or "unmatched"."""
+    partial = None
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route  # Path matches but the method doesn't: routed here for the 405
+    return partial.path if partial is not None else "unmatched"
+
+class RequestTimingMiddleware:
+    """
+    Plain ASGI middleware (cheaper than BaseHTTPMiddleware) that times each
+    request and labels it with the matched route template, not the raw path.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+        task = None
+        if profiler.enabled:
+            # Routing happens further in, so match the template here: profile filters name
+            # routes the way the metrics label them ("/items/{id}", not "/items/7")
+            route = route_template(scope)
+            if profiler.should_profile(route):
+                task = asyncio.current_task()
+                profiler.enter(task, route)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if task is not None:
+                profiler.exit(task)
+            elapsed = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe((scope["method"], route, str(status_code)), elapsed)
+            if elapsed >= SLOW_OPERATION_SECONDS:
+                slow_operations.inc(("request", route))
+                log.warning("Slow request", extra={"method": scope["method"], "route": route,
+                                                   "ms": round(elapsed * 1000, 1)})
+
+# --- Session Expiry Sweeper ---
+async def sweep_expired_sessions():
+    """
+    Background task removing expired sessions in small batches. Each batch
+    runs on a worker thread (it may wait on another worker's write lock), so
+    a large backlog or a contended file never stalls requests.
+    """
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        if session_signer is not None:
+            # Signed sessions expire on their own; only the denylist needs upkeep
+            await asyncio.to_thread(session_signer.denylist.sync)
+            continue
+        start = time.perf_counter()
+        removed = 0
+        while True:
+            batch = await asyncio.to_thread(session_store.sweep, limit=SESSION_SWEEP_BATCH)
+            removed += batch
+            if batch < SESSION_SWEEP_BATCH:
+                break
+        if removed:
+            record_store_operation("sweep_expired_sessions", time.perf_counter() - start)
+            live = await asyncio.to_thread(len, session_store)
+            log.info("Swept expired sessions", extra={"removed": removed, "live": live})
+
 # --- Pydantic Models ---
 class UserCredentials(BaseModel):
     username: str
@@ -31,6 +294,17 @@ class UserInfo(BaseModel):
 # --- FastAPI App Initialization ---
 app = FastAPI(title="Secure Login Backend")
 
+# --- Admission Control ---
+# Added first so it runs inside CORS (rejections still carry CORS headers and
+# preflights are never shed)
+app.add_middleware(
+    AdmissionMiddleware,
+    policies=ADMISSION_POLICIES,
+    default_policy=DEFAULT_ADMISSION_POLICY,
+    low_priority_ceiling=MAX_IN_FLIGHT,
+    on_reject=lambda route, reason: rejected_requests.inc((route, reason)),
+)
+
 # --- CORS Middleware ---
 # Allows requests from your frontend (adjust origin if needed)
 app.add_middleware(
@@ -40,44 +314,105 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*", CSRF_TOKEN_HEADER], # Allow the custom CSRF header
 )
+# Added last so it is outermost and its timings include CORS handling
+app.add_middleware(RequestTimingMiddleware)
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    app.state.session_sweeper = asyncio.create_task(sweep_expired_sessions())
+
+@app.on_event("startup")
+async def watch_event_loop_for_profiling():
+    profiler.watch_event_loop(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    app.state.session_sweeper.cancel()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+def stop_profiler():
+    profiler.stop()  # Writes out a profile still running
+
+@app.on_event("shutdown")
+def flush_logs():
+    log_listener.stop()
 
 
 # --- Helper Functions ---
+# The session helpers below are blocking: the SQLite store (and the signed-session
+# denylist) may wait up to busy_timeout for another worker's write lock. Handlers
+# call them through asyncio.to_thread so that wait never holds up the event loop.
 def generate_session_id() -> str:
     return secrets.token_urlsafe(32)
 
-def generate_csrf_token() -> str:
-    return secrets.token_hex(32)
-
+def csrf_token_for(session_id: str) -> Optional[str]:
+    """The CSRF token belonging to a session cookie (None for an unreadable signed token)."""
+    if session_signer is not None:
+        # Keyed on the session (jti), not the token, which changes on every renewal
+        session = session_signer.decode(session_id)
+        if session is None:
+            return None
+        session_id = session["jti"]
+    return hmac.new(csrf_secret, session_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def renewal_due(expires: float, now: float) -> bool:
+    """Whether enough of the TTL has passed since the last renewal to write a new expiry."""
+    return expires - now < SESSION_TTL_SECONDS * (1 - SESSION_RENEW_FRACTION)
+
+@timed_store_operation
 def create_session(username: str) -> str:
-    """Creates a new session, stores it, and returns the session ID."""
+    """Creates a new session, stores it, and returns the session ID (or signed token)."""
+    if session_signer is not None:
+        token = session_signer.issue(username)
+        log.info("Signed session issued", extra={"username": username})
+        return token
     session_id = generate_session_id()
     expires = time.time() + SESSION_TTL_SECONDS
-    active_sessions[session_id] = {"username": username, "expires": expires}
-    print(f"Session created for {username}: {session_id[:8]}..., expires: {time.ctime(expires)}")
+    session_store.put(session_id, {"username": username}, expires)
+    log.info("Session created", extra={"username": username, "session": session_id[:8], "expires": int(expires)})
     return session_id
 
+@timed_store_operation
 def get_session_data(session_id: str) -> Optional[Dict]:
-    """Retrieves session data if valid and not expired."""
-    session = active_sessions.get(session_id)
+    """
+    Retrieves session data if valid and not expired. "renewed" in the result
+    says whether its expiry was just extended, i.e. whether the cookies need
+    re-setting.
+    """
+    now = time.time()
+    if session_signer is not None:
+        # Pure CPU: signature, expiry and the in-memory denylist. Renewal means
+        # reissuing the token, which /session does when it re-sets the cookie.
+        session = session_signer.verify(session_id, now)
+        if not session:
+            log.info("Signed session invalid, expired or revoked")
+            return None
+        return dict(session, renewed=renewal_due(session["expires"], now))
+    # Expired sessions are removed by the lookup itself
+    session = session_store.get(session_id, now)
     if not session:
-        print(f"Session not found: {session_id[:8]}...")
-        return None
-    if time.time() > session["expires"]:
-        print(f"Session expired: {session_id[:8]}...")
-        # Clean up expired session
-        del active_sessions[session_id]
+        log.info("Session not found or expired", extra={"session": session_id[:8]})
         return None
-    # Extend session lifetime on activity (optional)
-    session["expires"] = time.time() + SESSION_TTL_SECONDS
-    print(f"Session validated for {session['username']}: {session_id[:8]}...")
-    return session
-
+    # Extend session lifetime on activity, at most once per SESSION_RENEW_FRACTION of the TTL
+    renewed = renewal_due(session["expires"], now)
+    if renewed:
+        session_store.renew(session_id, now + SESSION_TTL_SECONDS)
+    log.debug("Session validated", extra={"username": session["username"], "session": session_id[:8]})
+    return dict(session, renewed=renewed)
+
+@timed_store_operation
 def delete_session(session_id: str):
-    """Deletes a session from the store."""
-    if session_id in active_sessions:
-        print(f"Deleting session: {session_id[:8]}...")
-        del active_sessions[session_id]
+    """Deletes a session from the store (or revokes a signed one)."""
+    if session_signer is not None:
+        session_signer.revoke(session_id)
+        log.info("Signed session revoked")
+        return
+    if session_store.delete(session_id):
+        log.info("Session deleted", extra={"session": session_id[:8]})
 
 # --- CSRF Protection Dependency ---
 async def verify_csrf(
@@ -85,25 +420,27 @@ async def verify_csrf(
     csrf_token_header: Optional[str] = Header(None, alias=CSRF_TOKEN_HEADER)
 ):
     """
-    Dependency to verify CSRF token using Double Submit Cookie pattern.
-    Compares token from header with token from cookie.
+    Dependency to verify the CSRF token header. The expected token is derived
+    from the session cookie (see csrf_token_for), so the check needs no
+    store lookup and no stored token.
     """
-    csrf_token_cookie = request.cookies.get(CSRF_COOKIE_NAME)
+    session_id = request.cookies.get(SESSION_COOKIE_NAME)
 
-    if not csrf_token_cookie or not csrf_token_header:
-        print("CSRF Error: Missing token in cookie or header")
+    if not session_id or not csrf_token_header:
+        log.warning("CSRF token or session cookie missing")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="CSRF token missing or mismatch",
         )
 
-    if not secrets.compare_digest(csrf_token_cookie, csrf_token_header):
-        print(f"CSRF Error: Token mismatch. Cookie: {csrf_token_cookie[:8]}... Header: {csrf_token_header[:8]}...")
+    expected = csrf_token_for(session_id)
+    if expected is None or not secrets.compare_digest(expected, csrf_token_header):
+        log.warning("CSRF token mismatch")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="CSRF token missing or mismatch",
         )
-    print("CSRF token verified successfully.")
+    log.debug("CSRF token verified")
 
 
 # --- API Endpoints ---
@@ -118,15 +455,35 @@ async def login(credentials: UserCredentials, response: Response):
     - Sets CSRF token cookie (readable by JS).
     - Returns user info and CSRF token in body.
     """
-    print(f"Login attempt for user: {credentials.username}")
-    # --- !!! IMPORTANT: Replace with secure password verification !!! ---
+    log.debug("Login attempt", extra={"username": credentials.username})
+    wait = login_attempts_per_user.acquire(credentials.username)
+    if wait:
+        rejected_requests.inc(("/login", "user_rate_limited"))
+        log.warning("Login rejected: too many attempts for user", extra={"username": credentials.username})
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts for this account, please retry later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
     stored_password_hash = mock_users_db.get(credentials.username)
-    # Simulate password check (DO NOT use plain text comparison in production)
-    is_valid_password = (stored_password_hash is not None and
-                         credentials.password == "password123") # Replace with hash check
+    try:
+        # Unknown usernames are checked against a dummy hash, so they fail just as slowly
+        is_valid_password, new_hash = await password_hasher.verify(credentials.password, stored_password_hash)
+    except HasherSaturated:
+        rejected_requests.inc(("/login", "hash_queue_full"))
+        log.warning("Login rejected: password hash queue full", extra={"username": credentials.username})
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts right now, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if new_hash:
+        # Stored with outdated scrypt parameters: upgrade it now that we know the password
+        mock_users_db[credentials.username] = new_hash
+        log.info("Password rehashed with current parameters", extra={"username": credentials.username})
 
     if not is_valid_password:
-        print("Login failed: Invalid credentials")
+        log.warning("Login failed: invalid credentials", extra={"username": credentials.username})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -134,8 +491,8 @@ async def login(credentials: UserCredentials, response: Response):
         )
 
     # --- Credentials Valid - Create Session ---
-    session_id = create_session(credentials.username)
-    csrf_token = generate_csrf_token()
+    session_id = await asyncio.to_thread(create_session, credentials.username)
+    csrf_token = csrf_token_for(session_id)
 
     # Set Session Cookie (HttpOnly, Secure, SameSite)
     response.set_cookie(
@@ -159,7 +516,7 @@ async def login(credentials: UserCredentials, response: Response):
         path="/",
     )
 
-    print(f"Login successful for {credentials.username}. Session: {session_id[:8]}..., CSRF: {csrf_token[:8]}...")
+    log.info("Login successful", extra={"username": credentials.username, "session": session_id[:8]})
     return UserInfo(username=credentials.username, csrf_token=csrf_token)
 
 
@@ -172,17 +529,17 @@ async def logout(request: Request, response: Response, _=Depends(verify_csrf)):
     - Clears the session cookie.
     - Clears the CSRF cookie.
     """
-    print("Logout attempt...")
+    log.debug("Logout attempt")
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
 
     if session_id:
-        delete_session(session_id)
+        await asyncio.to_thread(delete_session, session_id)
 
     # Clear cookies by setting expiry in the past
     response.delete_cookie(SESSION_COOKIE_NAME, path="/", secure=True, httponly=True, samesite="lax")
     response.delete_cookie(CSRF_COOKIE_NAME, path="/", secure=True, httponly=False, samesite="lax")
 
-    print("Logout successful. Cookies cleared.")
+    log.info("Logout successful")
     return {"message": "Logout successful"}
 
 
@@ -190,46 +547,94 @@ async def logout(request: Request, response: Response, _=Depends(verify_csrf)):
 async def check_session(request: Request, response: Response):
     """
     Checks if a valid session exists based on the session cookie.
-    - If valid, returns user info and a *new* CSRF token.
-    - Renews session and CSRF cookies.
+    - If valid, returns user info and the session's CSRF token.
+    - Re-sets the session and CSRF cookies only when the session was renewed
+      (or the CSRF cookie is missing/stale).
     """
-    print("Session check attempt...")
+    log.debug("Session check attempt")
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
     if not session_id:
-        print("Session check failed: No session cookie found.")
+        log.debug("Session check failed: no session cookie")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
-    session_data = get_session_data(session_id)
+    session_data = await asyncio.to_thread(get_session_data, session_id)
     if not session_data:
         # Session invalid or expired, clear potentially stale cookies
         response.delete_cookie(SESSION_COOKIE_NAME, path="/", secure=True, httponly=True, samesite="lax")
         response.delete_cookie(CSRF_COOKIE_NAME, path="/", secure=True, httponly=False, samesite="lax")
-        print("Session check failed: Invalid or expired session.")
+        log.info("Session check failed: invalid or expired session")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session invalid or expired")
 
-    # --- Session Valid - Renew session and issue new CSRF ---
+    # --- Session Valid - Renew cookies if the session was renewed ---
     username = session_data["username"]
-    new_csrf_token = generate_csrf_token()
-
-    # Renew Session Cookie (optional but good practice)
-    response.set_cookie(
-        key=SESSION_COOKIE_NAME, value=session_id,
-        httponly=True, secure=True, samesite="lax", max_age=SESSION_TTL_SECONDS, path="/"
-    )
-    # Renew CSRF Token Cookie with new value
-    response.set_cookie(
-        key=CSRF_COOKIE_NAME, value=new_csrf_token,
-        httponly=False, secure=True, samesite="lax", max_age=SESSION_TTL_SECONDS, path="/"
-    )
+    csrf_token = csrf_token_for(session_id)
+    renewed = session_data["renewed"]
+    if renewed:
+        if session_signer is not None:
+            # Same session (jti), later expiry
+            session_id = session_signer.issue(username, jti=session_data["jti"])
+        response.set_cookie(
+            key=SESSION_COOKIE_NAME, value=session_id,
+            httponly=True, secure=True, samesite="lax", max_age=SESSION_TTL_SECONDS, path="/"
+        )
+    if renewed or request.cookies.get(CSRF_COOKIE_NAME) != csrf_token:
+        response.set_cookie(
+            key=CSRF_COOKIE_NAME, value=csrf_token,
+            httponly=False, secure=True, samesite="lax", max_age=SESSION_TTL_SECONDS, path="/"
+        )
 
-    print(f"Session check successful for {username}. Renewed cookies. New CSRF: {new_csrf_token[:8]}...")
-    return UserInfo(username=username, csrf_token=new_csrf_token)
+    log.debug("Session check successful", extra={"username": username, "renewed": renewed})
+    return UserInfo(username=username, csrf_token=csrf_token)
 
 # --- Root endpoint for basic check ---
 @app.get("/")
 async def root():
     return {"message": "Secure Login Backend is running!"}
 
+# --- Metrics endpoint for Prometheus ---
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # The session gauges count rows in the shared store
+    content = await asyncio.to_thread(metrics_registry.render)
+    return Response(content=content, media_type=PROMETHEUS_CONTENT_TYPE)
+
+# --- Profiling endpoint (this worker only; send the token in X-Profile-Token) ---
+def verify_profile_token(x_profile_token: Optional[str] = Header(None)):
+    """Dependency hiding the profiling endpoint unless AUTH_PROFILE_TOKEN is set, and requiring it."""
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_profile_token is None or not hmac.compare_digest(x_profile_token.encode("utf-8"),
+                                                          PROFILE_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profile token")
+
+@app.get("/admin/profile", include_in_schema=False, dependencies=[Depends(verify_profile_token)])
+async def profile_status(format: str = "json", route: Optional[str] = None):
+    """Status, or with ?format=collapsed|pstats the samples so far (of one ?route=, or all)."""
+    if format == "collapsed":
+        return Response(content=profiler.collapsed(route), media_type="text/plain")
+    if format == "pstats":
+        # Same bytes pstats.Stats.dump_stats() writes; load with pstats.Stats(path)
+        return Response(content=marshal.dumps(profiler.pstats(route).stats), media_type="application/octet-stream",
+                        headers={"Content-Disposition": "attachment; filename=profile.pstats"})
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be one of: json, collapsed, pstats")
+    return profiler.status()
+
+@app.post("/admin/profile", include_in_schema=False, dependencies=[Depends(verify_profile_token)])
+async def start_profile(rate: float = 1.0, seconds: float = 30.0, route: Optional[List[str]] = Query(None)):
+    """Profiles ?rate= of the requests (to the ?route= paths, if given) for ?seconds=."""
+    if not 0 < rate <= 1 or seconds <= 0:
+        raise HTTPException(status_code=400, detail="rate must be in (0, 1] and seconds positive")
+    if not profiler.start(sample_rate=rate, seconds=seconds, routes=route):
+        raise HTTPException(status_code=409, detail="A profile is already running; DELETE it first")
+    return profiler.status()
+
+@app.delete("/admin/profile", include_in_schema=False, dependencies=[Depends(verify_profile_token)])
+async def stop_profile():
+    """Stops the profile and writes it to AUTH_PROFILE_DIR."""
+    files = await asyncio.to_thread(profiler.stop)  # Joins the sampler and writes files: keep it off the loop
+    return dict(profiler.status(), files=files)
+
 # --- Optional: Run directly with uvicorn for local dev ---
 # if __name__ == "__main__":
 #     import uvicorn
@@ -0,0 +1,128 @@
+# passwords.py
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, Tuple
+
+
+class ScryptParams(NamedTuple):
+    n: int = 2 ** 14  # CPU/memory cost; memory used is about 128 * n * r bytes
+    r: int = 8
+    p: int = 1
+
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HasherSaturated(Exception):
+    """Raised when too many hash jobs are already queued; the caller should shed the request."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, params: ScryptParams) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=params.n, r=params.r, p=params.p,
+                          maxmem=256 * params.n * params.r * params.p + 2 ** 20, dklen=KEY_BYTES)
+
+
+def hash_password(password: str, params: ScryptParams) -> str:
+    """Returns 'scrypt$n$r$p$salt$key', with the parameters stored so they can change later."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _scrypt(password, salt, params)
+    return f"scrypt${params.n}${params.r}${params.p}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def verify_password(password: str, stored: str, params: ScryptParams) -> Tuple[bool, bool]:
+    """
+    Checks `password` against a stored hash. Returns (matches, needs_rehash),
+    where needs_rehash means it was hashed with other parameters than `params`.
+    """
+    try:
+        scheme, n, r, p, salt, key = stored.split("$")
+        stored_params = ScryptParams(int(n), int(r), int(p))
+        salt, key = _b64decode(salt), _b64decode(key)
+    except ValueError:
+        return False, False
+    if scheme != "scrypt":
+        return False, False
+    matches = hmac.compare_digest(_scrypt(password, salt, stored_params), key)
+    return matches, matches and stored_params != params
+
+
+class PasswordHasher:
+    """
+    Runs scrypt in a small thread pool so the event loop never waits on it
+    (hashlib releases the GIL while hashing, so other requests keep running).
+
+    At most `max_pending` jobs may be queued or running; past that, calls
+    fail at once with HasherSaturated instead of piling up, so a login burst
+    is turned away quickly rather than making everyone's requests slow.
+    """
+
+    def __init__(self, params: ScryptParams, workers: int, max_pending: int):
+        self.params = params
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.rejected_total = 0
+        # Verified against when the user doesn't exist, so unknown usernames take as long as wrong passwords
+        self._dummy_hash = hash_password(secrets.token_urlsafe(16), params)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected_total += 1
+                raise HasherSaturated()
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.params)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """
+        Returns (matches, new_hash). new_hash is set when the password matched
+        but was stored with outdated parameters: the caller should save it.
+        """
+        if stored is None:
+            await self._run(verify_password, password, self._dummy_hash, self.params)
+            return False, None
+        matches, needs_rehash = await self._run(verify_password, password, stored, self.params)
+        if needs_rehash:
+            try:
+                return True, await self.hash(password)
+            except HasherSaturated:
+                pass  # Rehash on a later login
+        return matches, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def params_from_env() -> ScryptParams:
+    """Scrypt cost from AUTH_SCRYPT_N / AUTH_SCRYPT_R / AUTH_SCRYPT_P (defaults: 16384, 8, 1)."""
+    defaults = ScryptParams()
+    return ScryptParams(int(os.environ.get("AUTH_SCRYPT_N", defaults.n)),
+                        int(os.environ.get("AUTH_SCRYPT_R", defaults.r)),
+                        int(os.environ.get("AUTH_SCRYPT_P", defaults.p)))
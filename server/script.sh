@@ -10,6 +10,10 @@ APP_GROUP="mysecureappgroup" # Group for the user
 APP_DIR="/opt/${APP_NAME}"
 VENV_DIR="${APP_DIR}/venv"
 BACKEND_FILE="backend.py"
+# Modules imported by backend.py, deployed alongside it
+SUPPORT_FILES="admission.py passwords.py session_store.py signed_sessions.py structured_log.py"
+# Modules shared with the shop, kept in the repository's common/ directory
+SHARED_FILES="../common/metrics.py ../common/profiling.py"
 SERVICE_NAME="${APP_NAME}.service"
 NGINX_CONF_NAME="${APP_NAME}"
 # Change if your backend runs on a different port
@@ -57,6 +61,14 @@ else
     echo "Error: ${BACKEND_FILE} not found in the current directory." >&2
     exit 1
 fi
+for SUPPORT_FILE in ${SUPPORT_FILES} ${SHARED_FILES}; do
+    if [ -f "${SUPPORT_FILE}" ]; then
+        cp "${SUPPORT_FILE}" "${APP_DIR}/"
+    else
+        echo "Error: ${SUPPORT_FILE} not found in the current directory." >&2
+        exit 1
+    fi
+done
 
 # --- 3. Create Python Virtual Environment & Install Dependencies ---
 echo "Creating Python virtual environment at ${VENV_DIR}..."
@@ -92,6 +104,9 @@ User=${APP_USER}
 Group=${APP_GROUP}
 WorkingDirectory=${APP_DIR}
 Environment="PATH=${VENV_DIR}/bin"
+# Sessions live in one SQLite file shared by all workers, so any worker can serve any session
+Environment="AUTH_SESSION_DB=${APP_DIR}/sessions.db"
+Environment="AUTH_PROFILE_DIR=${APP_DIR}/profiles"
 # Command to start Gunicorn with Uvicorn workers
 ExecStart=${VENV_DIR}/bin/gunicorn --workers 3 --worker-class uvicorn.workers.UvicornWorker --bind ${GUNICORN_BIND_ADDRESS} main:app
 Restart=always
@@ -200,7 +215,9 @@ echo "   (Follow Certbot prompts. It will automatically update the Nginx config)
 echo "3.  **FRONTEND:** Place your updated index.html file where Nginx can serve it (e.g., /var/www/html or configure Nginx to serve it from ${APP_DIR}/static if you prefer)."
 echo "   Update API_BASE_URL in index.html to 'https://your_domain.com' after setting up HTTPS."
 echo "4.  **DATABASE:** Replace the in-memory session store and mock user DB in backend.py with a persistent database (e.g., PostgreSQL, MySQL) or Redis."
-echo "5.  **PASSWORD HASHING:** Implement proper password hashing (e.g., using passlib) in backend.py instead of plain text comparison."
+echo "5.  **PASSWORD HASHING:** Passwords are checked with scrypt; tune AUTH_SCRYPT_N/R/P and AUTH_HASH_WORKERS for this host (existing hashes upgrade on next login)."
 echo "6.  **SECRETS MANAGEMENT:** Do not hardcode sensitive information. Use environment variables or a proper secrets management tool."
 echo "7.  **MONITORING & LOGGING:** Set up monitoring and centralized logging for your application and server."
+echo "8.  **PROFILING:** To profile the workers for 30s, signal the workers (not the Gunicorn master, where USR2 means upgrade):"
+echo "   sudo pkill -USR2 -P \$(systemctl show -p MainPID --value ${SERVICE_NAME})   # results in ${APP_DIR}/profiles"
 echo "------------------------------"
\ No newline at end of file
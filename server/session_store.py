@@ -0,0 +1,288 @@
+# session_store.py
+import heapq
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class MemorySessionStore:
+    """
+    In-process session store with an expiry index.
+
+    Sessions live in a dict; a min-heap of (expires, session_id) orders them
+    by expiry so expired entries can be found without scanning the dict. The
+    heap holds one entry per session: renewing a session only updates its
+    dict entry, and a heap entry found to be stale (the session was renewed
+    or deleted since) is re-pushed with the current expiry or dropped when
+    it reaches the top. So renewals stay O(1) and the heap never outgrows
+    the sessions it indexes by more than the recently deleted ones.
+
+    When the store is full, creating a session first evicts the one closest
+    to expiry.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._sessions: Dict[str, Dict] = {}
+        self._expiry_heap = []  # (expires, session_id), earliest first
+        self._lock = threading.Lock()
+        self.expired_total = 0  # Removed because their TTL ran out (by the sweeper or on lookup)
+        self.evicted_total = 0  # Removed early to stay within max_size
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def put(self, session_id: str, data: Dict, expires: float):
+        """Stores a new session, evicting the one closest to expiry if the store is full."""
+        with self._lock:
+            while len(self._sessions) >= self.max_size and self._pop_earliest(None):
+                self.evicted_total += 1
+            self._sessions[session_id] = dict(data, expires=expires)
+            heapq.heappush(self._expiry_heap, (expires, session_id))
+
+    def get(self, session_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        """Returns the session, or None if it doesn't exist or has expired (and removes it)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if now > session["expires"]:
+                del self._sessions[session_id]  # Its heap entry is dropped when it surfaces
+                self.expired_total += 1
+                return None
+            return session
+
+    def renew(self, session_id: str, expires: float):
+        """Pushes a session's expiry out. The heap catches up lazily."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session["expires"] = expires
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def sweep(self, now: Optional[float] = None, limit: int = 500) -> int:
+        """
+        Removes up to `limit` expired sessions, earliest first, and returns how
+        many were removed. Stops early once the earliest session is still live.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            while removed < limit and self._pop_earliest(now):
+                removed += 1
+            self.expired_total += removed
+        return removed
+
+    def _pop_earliest(self, now: Optional[float]) -> bool:
+        """
+        Removes the session with the earliest expiry, if it expired before
+        `now` (or unconditionally when now is None). Returns whether one was
+        removed. Caller holds the lock.
+        """
+        heap = self._expiry_heap
+        while heap:
+            expires, session_id = heap[0]
+            if now is not None and expires > now:
+                return False
+            session = self._sessions.get(session_id)
+            if session is None:
+                heapq.heappop(heap)  # Deleted, or already expired on lookup
+            elif session["expires"] != expires:
+                heapq.heapreplace(heap, (session["expires"], session_id))  # Renewed since
+            else:
+                heapq.heappop(heap)
+                del self._sessions[session_id]
+                return True
+        return False
+
+
+class SqliteSessionStore:
+    """
+    Session store in a SQLite file (WAL mode) shared by every worker on the
+    host, so a session created on one worker is valid on all of them.
+
+    Same interface as MemorySessionStore. The size cap is enforced by the
+    sweeper rather than on every insert (counting rows on each login would
+    cost more than the sessions it saves), so the store can overshoot
+    max_size by one sweep interval's worth of logins. The expired/evicted
+    totals count what this worker removed.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.expired_total = 0
+        self.evicted_total = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """The calling process's connection. Opened lazily so forked workers never share one."""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    expires REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)")
+            conn.execute("CREATE TABLE IF NOT EXISTS shared_secrets (name TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def shared_secret(self, name: str) -> bytes:
+        """A random secret stored alongside the sessions: the first worker to ask creates it."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR IGNORE INTO shared_secrets (name, value) VALUES (?, ?)",
+                         (name, secrets.token_bytes(32)))
+            return conn.execute("SELECT value FROM shared_secrets WHERE name = ?", (name,)).fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def put(self, session_id: str, data: Dict, expires: float):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO sessions (session_id, username, expires) VALUES (?, ?, ?)",
+                (session_id, data["username"], expires))
+
+    def get(self, session_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT username, expires FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            if row is None:
+                return None
+            if now > row[1]:
+                if conn.execute("DELETE FROM sessions WHERE session_id = ? AND expires = ?",
+                                (session_id, row[1])).rowcount:
+                    self.expired_total += 1
+                return None
+            return {"username": row[0], "expires": row[1]}
+
+    def renew(self, session_id: str, expires: float):
+        with self._lock:
+            # Never shorten: another worker may have renewed it further already
+            self._connection().execute("UPDATE sessions SET expires = ? WHERE session_id = ? AND expires < ?",
+                                       (expires, session_id, expires))
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._connection().execute("DELETE FROM sessions WHERE session_id = ?",
+                                              (session_id,)).rowcount > 0
+
+    def sweep(self, now: Optional[float] = None, limit: int = 500) -> int:
+        """
+        Removes up to `limit` expired sessions, then (once no expired ones are
+        left) evicts the sessions closest to expiry while the store is over
+        max_size. Returns how many were removed.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute("""
+                DELETE FROM sessions WHERE session_id IN (
+                    SELECT session_id FROM sessions WHERE expires < ? ORDER BY expires LIMIT ?)
+            """, (now, limit)).rowcount
+            self.expired_total += removed
+            if removed < limit:
+                excess = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_size
+                if excess > 0:
+                    evicted = conn.execute("""
+                        DELETE FROM sessions WHERE session_id IN (
+                            SELECT session_id FROM sessions ORDER BY expires LIMIT ?)
+                    """, (min(excess, limit - removed),)).rowcount
+                    self.evicted_total += evicted
+                    removed += evicted
+        return removed
+
+
+class CachedSessionStore:
+    """
+    Small per-worker read-through cache in front of a shared store.
+
+    A cached session is trusted for up to `ttl` seconds, so most session
+    checks are answered in-process. Writes go straight through. The flip
+    side: a logout on one worker can take up to `ttl` seconds to reach the
+    caches of the others, so keep `ttl` short.
+    """
+
+    def __init__(self, backend, ttl: float, max_entries: int = 10000):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # session_id -> (session, cached_at)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def expired_total(self):
+        return self.backend.expired_total
+
+    @property
+    def evicted_total(self):
+        return self.backend.evicted_total
+
+    def __len__(self):
+        return len(self.backend)
+
+    def _remember(self, session_id: str, session: Dict, now: float):
+        with self._lock:
+            self._cache[session_id] = (session, now)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def put(self, session_id: str, data: Dict, expires: float):
+        self.backend.put(session_id, data, expires)
+        self._remember(session_id, dict(data, expires=expires), time.time())
+
+    def get(self, session_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                session, cached_at = entry
+                if now - cached_at < self.ttl and now <= session["expires"]:
+                    self.hits += 1
+                    return session
+                del self._cache[session_id]
+            self.misses += 1
+        session = self.backend.get(session_id, now)
+        if session is not None:
+            self._remember(session_id, session, now)
+        return session
+
+    def renew(self, session_id: str, expires: float):
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                entry[0]["expires"] = expires
+        self.backend.renew(session_id, expires)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._cache.pop(session_id, None)
+        return self.backend.delete(session_id)
+
+    def sweep(self, now: Optional[float] = None, limit: int = 500) -> int:
+        return self.backend.sweep(now, limit)
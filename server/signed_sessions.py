@@ -0,0 +1,180 @@
+# signed_sessions.py
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def parse_signing_keys(text: str) -> Tuple[Dict[str, bytes], str]:
+    """
+    Parses AUTH_SIGNING_KEYS ("kid:secret,kid:secret,..."). The first key signs
+    new tokens; the rest are only accepted, so a key can be rotated out by
+    moving a new one to the front and dropping the old one a TTL later.
+    Returns ({kid: secret}, active kid).
+    """
+    keys = {}
+    for item in text.split(","):
+        kid, sep, secret = item.strip().partition(":")
+        if not sep or not kid or not secret or "." in kid:
+            raise ValueError("AUTH_SIGNING_KEYS must look like 'kid:secret,kid:secret' (kid without dots)")
+        if kid in keys:
+            raise ValueError(f"Duplicate signing key id: {kid!r}")
+        keys[kid] = secret.encode("utf-8")
+    if not keys:
+        raise ValueError("AUTH_SIGNING_KEYS is empty")
+    return keys, next(iter(keys))
+
+
+class Denylist:
+    """
+    Session ids (jti) revoked by logout, each kept only until every token
+    carrying it has expired anyway.
+
+    Lookups only touch an in-process dict. With a `path`, revocations are
+    also written to a shared SQLite table, and sync() (run periodically by
+    each worker) pulls in the ones made by other workers, so a logout
+    reaches every worker within one sync interval.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._entries: Dict[str, float] = {}  # jti -> expires
+        self._expiry_heap = []                # (expires, jti), earliest first
+        self._last_rowid = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._entries
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS revoked_sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    jti TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_revoked_sessions_expires ON revoked_sessions (expires)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _add(self, jti: str, expires: float):
+        if self._entries.get(jti, 0) < expires:
+            self._entries[jti] = expires
+            heapq.heappush(self._expiry_heap, (expires, jti))
+
+    def revoke(self, jti: str, expires: float):
+        with self._lock:
+            self._add(jti, expires)
+            if self.path:
+                self._connection().execute("INSERT INTO revoked_sessions (jti, expires) VALUES (?, ?)",
+                                           (jti, expires))
+
+    def sync(self, now: Optional[float] = None) -> int:
+        """
+        Pulls revocations made by other workers, then drops entries whose
+        tokens have all expired. Returns how many local entries were dropped.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.path:
+                conn = self._connection()
+                rows = conn.execute("SELECT id, jti, expires FROM revoked_sessions WHERE id > ? ORDER BY id",
+                                    (self._last_rowid,)).fetchall()
+                for rowid, jti, expires in rows:
+                    self._add(jti, expires)
+                    self._last_rowid = rowid
+                conn.execute("DELETE FROM revoked_sessions WHERE expires < ?", (now,))
+            dropped = 0
+            heap = self._expiry_heap
+            while heap and heap[0][0] < now:
+                expires, jti = heapq.heappop(heap)
+                if self._entries.get(jti) == expires:
+                    del self._entries[jti]
+                    dropped += 1
+            return dropped
+
+
+class SessionSigner:
+    """
+    Issues and checks self-contained session tokens:
+
+        <kid>.<base64url(JSON [username, expires, jti])>.<base64url(HMAC-SHA256)>
+
+    The MAC covers "<kid>.<payload>" and is compared in constant time, so a
+    token is validated with a little CPU and no store lookup. jti names the
+    login session: it stays the same when a token is reissued with a later
+    expiry, so revoking it on logout covers every token issued for it.
+    """
+
+    def __init__(self, keys: Dict[str, bytes], active_kid: str, ttl: float, denylist: Denylist):
+        self.keys = keys
+        self.active_kid = active_kid
+        self.ttl = ttl
+        self.denylist = denylist
+
+    def _sign(self, kid: str, signed_part: str) -> bytes:
+        return hmac.new(self.keys[kid], signed_part.encode("ascii"), hashlib.sha256).digest()
+
+    def issue(self, username: str, jti: Optional[str] = None, now: Optional[float] = None) -> str:
+        """Returns a token for `username` valid for one TTL (a new session unless `jti` is given)."""
+        now = time.time() if now is None else now
+        jti = jti or secrets.token_urlsafe(12)
+        payload = _b64encode(json.dumps([username, int(now + self.ttl), jti], separators=(",", ":")).encode("utf-8"))
+        signed_part = f"{self.active_kid}.{payload}"
+        return f"{signed_part}.{_b64encode(self._sign(self.active_kid, signed_part))}"
+
+    def decode(self, token: str) -> Optional[Dict]:
+        """The token's session data if its signature is valid (expiry and revocation not checked)."""
+        try:
+            kid, payload, signature = token.split(".")
+            if kid not in self.keys:
+                return None
+            if not hmac.compare_digest(_b64decode(signature), self._sign(kid, f"{kid}.{payload}")):
+                return None
+            username, expires, jti = json.loads(_b64decode(payload))
+        except (ValueError, TypeError, UnicodeError):
+            return None
+        return {"username": username, "expires": expires, "jti": jti, "kid": kid}
+
+    def verify(self, token: str, now: Optional[float] = None) -> Optional[Dict]:
+        """The token's session data, or None if it is forged, expired or revoked."""
+        session = self.decode(token)
+        if session is None:
+            return None
+        now = time.time() if now is None else now
+        if now > session["expires"] or session["jti"] in self.denylist:
+            return None
+        return session
+
+    def revoke(self, token: str, now: Optional[float] = None):
+        """Revokes the token's session (until the latest token for it could have expired)."""
+        session = self.decode(token)
+        if session is not None:
+            now = time.time() if now is None else now
+            self.denylist.revoke(session["jti"], now + self.ttl)
@@ -0,0 +1,116 @@
+# structured_log.py
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+# Attributes every LogRecord has; anything else on a record came in through extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, plus any extra={...} fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of the records at each level, e.g. {logging.DEBUG: 0.01}."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    A token bucket per message template (the unformatted msg), so one chatty
+    call site can't flood the log while others still get through. The next
+    record let through from a throttled template carries how many were
+    dropped in the meantime as `suppressed`.
+    """
+
+    def __init__(self, per_second, burst):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst
+        self._buckets = {}  # template -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        key = (record.levelno, str(record.msg))
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records (and counts them) when the queue is full instead of blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(name, level=logging.INFO, sample_rates=None, per_second=20.0, burst=50,
+                      queue_size=10000, stream=None):
+    """
+    Sets up `name` to log JSON lines from a background thread: the calling
+    thread only filters the record and puts it on a bounded queue, and a
+    QueueListener thread does the formatting and the blocking write to
+    `stream` (stdout by default). Sampling and rate limiting run before the
+    record is queued, so dropped records cost almost nothing.
+    Returns (logger, handler, listener); stop the listener to flush on exit.
+    """
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+    handler.addFilter(RateLimitFilter(per_second, burst))
+    listener = logging.handlers.QueueListener(handler.queue, output)
+    listener.start()
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    return logger, handler, listener